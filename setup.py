@@ -28,7 +28,8 @@ setuptools.setup(
         "Programming Language :: Python :: 3.7",
     ],
     packages=setuptools.find_packages(),
-    python_requires=">=3.5",
+    python_requires=">=3.7",
     install_requires=["numpy","matplotlib","pandas","jinja2","scipy",
                       "timezonefinder"],
+    extras_require={"arrow": ["pyarrow"]},
 )
\ No newline at end of file
@@ -0,0 +1,75 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from tidepredict import export, extrematable
+from test_tide import make_tide
+
+STATION = {'name': "Lyttelton", 'country': "New Zealand", 'lat': -43.6,
+           'lon': 172.7, 'tzone': "Pacific/Auckland"}
+START = datetime.datetime(2019, 10, 1, tzinfo = datetime.timezone.utc)
+END = datetime.datetime(2019, 10, 8, tzinfo = datetime.timezone.utc)
+
+def test_export_npy(tmp_path):
+    tide = make_tide()
+    path = tmp_path / "lyttelton"
+    heights, extrema = export.export(tide, STATION, START, END, 10, path,
+                                     chunk = 100)
+    assert heights == 7 * 144 + 1
+
+    data, meta = export.load(path)
+    assert meta["station"] == "Lyttelton"
+    assert meta["timezone"] == "Pacific/Auckland"
+    assert meta["model"] == extrematable.model_hash(tide)
+    assert meta["count"] == heights and meta["step_ms"] == 600000
+    assert data["height"].dtype == np.float32
+    assert data["time"][0] == np.datetime64("2019-10-01T00:00")
+    assert data["time"][-1] == np.datetime64("2019-10-08T00:00")
+    assert np.allclose(data["height"], tide.at(data["time"]), atol = 1e-3)
+
+    data, meta = export.load(export.extrema_path(path))
+    assert meta["kind"] == "extrema" and meta["count"] == extrema
+    expected = list(tide.extrema(START, END))
+    assert len(data["time"]) == len(expected)
+    assert (data["time"] == np.array([e[0].replace(tzinfo = None)
+                                      for e in expected],
+                                     dtype = "datetime64[ms]")).all()
+    assert np.allclose(data["height"], [e[1] for e in expected], atol = 1e-6)
+    assert data["type"].tolist() == [e[2].encode() for e in expected]
+
+def test_export_arrow(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    import json
+    import pyarrow.ipc
+    import pyarrow.parquet
+    tide = make_tide()
+    export.export(tide, STATION, START, END, 10, tmp_path / "a.npy")
+    for format in ("arrow", "parquet"):
+        path = tmp_path / ("a." + format)
+        export.export(tide, STATION, START, END, 10, path, format,
+                      chunk = 100)
+        for name, npy in ((path, "a.npy"),
+                          (export.extrema_path(path), "a_extrema.npy")):
+            if format == "arrow":
+                table = pa.ipc.open_file(str(name)).read_all()
+            else:
+                table = pa.parquet.read_table(str(name))
+            meta = json.loads(table.schema.metadata[b"tidepredict"])
+            assert meta["model"] == extrematable.model_hash(tide)
+            expected, _ = export.load(tmp_path / npy)
+            assert np.array_equal(table.column("height").to_numpy(),
+                                  expected["height"])
+            assert np.array_equal(table.column("time").to_numpy()
+                                  .astype("datetime64[ms]"), expected["time"])
+
+def test_bad_format(tmp_path):
+    with pytest.raises(ValueError):
+        export.export(make_tide(), STATION, START, END, 10,
+                      tmp_path / "a.csv", "csv")
+
+def test_export_needs_location():
+    from tidepredict import __main__
+    args = __main__.parser.parse_args(["-m", "l", "-export", "npy"])
+    with pytest.raises(SystemExit):
+        __main__.process_args(args)
@@ -0,0 +1,59 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from tidepredict import constants, extrematable
+from test_tide import make_tide
+
+@pytest.fixture
+def tables(tmp_path, monkeypatch):
+    monkeypatch.setattr(constants, "EXTREMADIR", tmp_path)
+    return tmp_path
+
+def compare(tide, t0, t1):
+    table = list(tide.extrema(t0, t1))
+    computed = list(tide.extrema(t0, t1, tables = False))
+    assert [e[2] for e in table] == [e[2] for e in computed]
+    for (ta, ha, _), (tc, hc, _) in zip(table, computed):
+        assert type(ta) == type(tc)
+        assert abs((ta - tc) / np.timedelta64(1, 's')
+                   if isinstance(ta, np.datetime64)
+                   else (ta - tc).total_seconds()) < 60
+        assert abs(ha - hc) < 1e-3
+    return table
+
+def test_build(tables):
+    tide = make_tide()
+    assert extrematable.get_table(tide) is None
+    table = extrematable.build(tide, 2019, 2019)
+    assert len(table) > 1400 and table.heights.dtype == np.float32
+    assert (tables / ("%s.npz" % extrematable.model_hash(tide))).exists()
+
+    utc = datetime.timezone.utc
+    compare(tide, datetime.datetime(2019, 3, 1, 5, 17),
+            datetime.datetime(2019, 3, 9))
+    e = compare(tide, datetime.datetime(2019, 12, 30, tzinfo = utc),
+                datetime.datetime(2020, 1, 1, tzinfo = utc))
+    assert e[0][0].tzinfo is utc
+    compare(tide, np.datetime64("2019-06-01T00:00"),
+            np.datetime64("2019-06-03T00:00"))
+    #windows outside the table are computed
+    assert extrematable.find(tide, datetime.datetime(2019, 12, 31),
+                             datetime.datetime(2020, 1, 2)) is None
+
+    #extending the table keeps the years already covered
+    table = extrematable.build(tide, 2020, 2020)
+    assert extrematable.find(tide, datetime.datetime(2019, 1, 1),
+                             datetime.datetime(2021, 1, 1)) is not None
+
+def test_model_hash():
+    tide = make_tide()
+    key = extrematable.model_hash(tide)
+    assert extrematable.model_hash(make_tide()) == key
+    other = make_tide()
+    other.model['amplitude'][1] += 1e-6
+    assert extrematable.model_hash(other) != key
+    other = make_tide()
+    other.extrema_partition = 240.0
+    assert extrematable.model_hash(other) != key
@@ -0,0 +1,129 @@
+import errno
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from tidepredict import ftp_helpers
+
+pyftpdlib = pytest.importorskip("pyftpdlib")
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import ThreadedFTPServer
+
+@pytest.fixture
+def ftpserver(tmp_path, monkeypatch):
+    """A local anonymous FTP server serving tmp_path/root, with the download
+    cache in tmp_path/cache.
+    """
+    root = tmp_path / "root"
+    root.mkdir()
+    retrieved = []
+
+    class Handler(FTPHandler):
+        delay = 0.0
+        def ftp_RETR(self, file):
+            retrieved.append(file)
+            time.sleep(self.delay)
+            return super().ftp_RETR(file)
+
+    authorizer = DummyAuthorizer()
+    authorizer.add_anonymous(str(root))
+    Handler.authorizer = authorizer
+    server = ThreadedFTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever,
+                              kwargs={"timeout": 0.1})
+    thread.start()
+    monkeypatch.setattr(ftp_helpers, "cache",
+                        ftp_helpers.DownloadCache(tmp_path / "cache"))
+    monkeypatch.setattr(ftp_helpers, "pool", ftp_helpers.FTPPool())
+    Handler.timeout = 0.5
+    yield SimpleNamespace(address="127.0.0.1:%i" % server.address[1],
+                          root=root, retrieved=retrieved, handler=Handler)
+    ftp_helpers.pool.close()
+    server.close_all()
+    thread.join()
+
+def test_download_cache(ftpserver, monkeypatch):
+    address, root, retrieved = ftpserver.address, ftpserver.root, \
+        ftpserver.retrieved
+    (root / "pacific.lst").write_bytes(b"001 station list")
+    assert ftp_helpers.get_byte_stream(address, "pacific.lst").read() == \
+        b"001 station list"
+    assert ftp_helpers.get_byte_stream(address, "pacific.lst").read() == \
+        b"001 station list"
+    assert len(retrieved) == 1
+    (root / "pacific.lst").write_bytes(b"002 updated station list")
+    assert ftp_helpers.get_byte_stream(address, "pacific.lst").read() == \
+        b"002 updated station list"
+    assert len(retrieved) == 2
+    monkeypatch.setattr(ftp_helpers, "offline", True)
+    assert ftp_helpers.get_byte_stream(address, "pacific.lst").read() == \
+        b"002 updated station list"
+    with pytest.raises(ftp_helpers.OfflineError):
+        ftp_helpers.get_byte_stream(address, "indian.lst")
+
+def test_download_cache_eviction(ftpserver):
+    address, root, retrieved = ftpserver.address, ftpserver.root, \
+        ftpserver.retrieved
+    ftp_helpers.cache.maxsize = 150
+    for name in "abc":
+        (root / name).write_bytes(name.encode() * 60)
+        ftp_helpers.get_file(address, name)
+    assert ftp_helpers.cache.lookup("%s/a" % address) is None
+    assert ftp_helpers.cache.lookup("%s/c" % address) is not None
+
+def test_evicted_after_lookup(ftpserver, monkeypatch):
+    address, root, retrieved = ftpserver.address, ftpserver.root, \
+        ftpserver.retrieved
+    (root / "a").write_bytes(b"a")
+    ftp_helpers.get_file(address, "a")
+    #another download evicts the file between its lookup and use
+    lookup = ftp_helpers.cache.lookup
+    def evicting_lookup(key):
+        entry = lookup(key)
+        ftp_helpers.cache.clear()
+        return entry
+    monkeypatch.setattr(ftp_helpers.cache, "lookup", evicting_lookup)
+    assert ftp_helpers.get_file(address, "a").read_bytes() == b"a"
+    assert len(retrieved) == 2
+
+def test_local_error_not_retried(ftpserver, monkeypatch):
+    address, root = ftpserver.address, ftpserver.root
+    (root / "a").write_bytes(b"a")
+    ftp_helpers.get_file(address, "a")
+    def store(*args):
+        raise OSError(errno.ENOSPC, "No space left on device")
+    monkeypatch.setattr(ftp_helpers.cache, "store", store)
+    (root / "a").write_bytes(b"updated")
+    with pytest.raises(OSError):
+        ftp_helpers.get_file(address, "a")
+    #not retried on a new session, and the session used is closed
+    assert ftp_helpers.pool.connections == 1
+    assert not ftp_helpers.pool._idle[address]
+
+def test_connection_pool(ftpserver):
+    address, root, retrieved = ftpserver.address, ftpserver.root, \
+        ftpserver.retrieved
+    for name in "abc":
+        (root / name).write_bytes(name.encode())
+    ftp_helpers.get_files(address, ["a", "b", "c"], max_workers=1)
+    assert ftp_helpers.pool.connections == 1
+    #sessions closed by the server's idle timeout are replaced, whether or
+    #not they are checked before use
+    for maxidle in (0.0, 60.0):
+        ftp_helpers.pool.maxidle = maxidle
+        time.sleep(1.0)
+        assert ftp_helpers.get_byte_stream(address, "a").read() == b"a"
+    assert ftp_helpers.pool.connections == 3
+
+def test_fetch_many(ftpserver):
+    address, root, retrieved = ftpserver.address, ftpserver.root, \
+        ftpserver.retrieved
+    ftpserver.handler.delay = 0.5
+    names = ["pacific.lst", "indian.lst", "atlantic.lst"]
+    for name in names:
+        (root / name).write_bytes(name.encode())
+    start = time.time()
+    streams = ftp_helpers.get_byte_streams(address, names, max_workers=3)
+    assert time.time() - start < 1.2
+    assert [stream.read() for stream in streams] == [n.encode() for n in names]
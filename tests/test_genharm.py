@@ -0,0 +1,85 @@
+import io
+import zipfile
+
+import numpy as np
+import pytest
+
+from tidepredict import genharm, harmstore
+
+def make_station(code, name, country, oc_idx = "P"):
+    return {"stat_idx": code, "oc_idx": oc_idx, "loc_name": name,
+            "country": country, "Lat": "43-36S", "Lon": "172-43E",
+            "data_years": "2017-2018", "Contributor": "LINZ",
+            "tzone": "Pacific/Auckland"}
+
+STATIONS = [make_station("551A", "Lyttelton", "New Zealand"),
+            make_station("552A", "Broken", "New Zealand"),
+            make_station("057A", "Honolulu", "USA"),
+            make_station("823A", "Brest", "France", "A")]
+
+def make_archive(path, code):
+    """Writes a zip archive of two years of hourly data for a station"""
+    hours = np.arange(np.datetime64("2017-01-01T00"),
+                      np.datetime64("2019-01-01T00"))
+    t = (hours - hours[0]).astype(float)
+    heights = 1500 + 800*np.cos(2*np.pi*t/12.4206) \
+              + 150*np.cos(2*np.pi*t/23.9345 + 1)
+    heights = heights.astype(int).reshape(-1, 12)
+    days = hours[::24].astype("datetime64[D]").astype(str)
+    with zipfile.ZipFile(path, "w") as z:
+        for year in (2017, 2018):
+            lines = ["%s header" % code]
+            for i, day in enumerate(days):
+                if day.startswith(str(year)):
+                    for half in (1, 2):
+                        row = heights[2*i + half - 1]
+                        lines.append("%-10s %s%i" % (code, day.replace("-", ""),
+                                                     half)
+                                     + "".join("%5i" % v for v in row))
+            z.writestr("i%s%02i.dat" % (code, year % 100), "\n".join(lines))
+
+def test_select_stations():
+    def codes(selected):
+        return [s["stat_idx"] for s in selected]
+    assert codes(genharm.select_stations(STATIONS, "pacific")) == \
+        ["551A", "552A", "057A"]
+    assert codes(genharm.select_stations(STATIONS, "all", ["new zealand"])) \
+        == ["551A", "552A"]
+    assert codes(genharm.select_stations(STATIONS, codes = ["h823a", "057a"])) \
+        == ["057A", "823A"]
+    assert genharm.select_stations(STATIONS, "atlantic", ["USA"]) == []
+    with pytest.raises(ValueError):
+        genharm.select_stations(STATIONS, "arctic")
+
+def test_run(tmp_path, monkeypatch):
+    archive = tmp_path / "h551a.zip"
+    make_archive(archive, "551a")
+    qafile = tmp_path / "qa551a.dmt"
+    qafile.write_text("Time Meridian: GMT\n")
+
+    def fetch(thestation):
+        if thestation["stat_idx"] == "552A":
+            raise EnvironmentError("no such file")
+        return archive, qafile
+    monkeypatch.setattr(genharm, "fetch", fetch)
+
+    selected = genharm.select_stations(STATIONS, "all", ["new zealand"])
+    out = io.StringIO()
+    with harmstore.HarmonicStore(tmp_path / "harms.sqlite", False) as store:
+        failed = genharm.run(selected, store, "test", processes = 2,
+                             out = out)
+        assert list(failed) == ["h552a"]
+        assert store.codes() == ["h551a"]
+        station, tide = store.load("h551a")
+        assert station["name"] == "Lyttelton" and station["meridian"] == "GMT"
+        m2 = [row for row in tide.model if row["constituent"].name == "M2"]
+        #the synthetic data has no nodal modulation, so allow for f
+        assert abs(m2[0]["amplitude"] - 0.8) < 0.05
+        assert "failed: no such file" in out.getvalue()
+
+        #resuming only retries the station which failed
+        out = io.StringIO()
+        failed = genharm.run(selected, store, "test", processes = 1,
+                             out = out)
+        assert list(failed) == ["h552a"]
+        assert "Skipping 1 stations" in out.getvalue()
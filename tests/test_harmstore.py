@@ -0,0 +1,70 @@
+import datetime
+import json
+import sqlite3
+
+import numpy as np
+import pytest
+
+from tidepredict import constants, harmstore, processdata
+
+def make_station():
+    return {"name": "Lyttelton", "country": "New Zealand", "lat": -43.6,
+            "lon": 172.7, "tzone": "Pacific/Auckland",
+            "cons": ["Z0", "M2", "S2", "K1"],
+            "amps": [1.5, 0.9, 0.1, 0.05],
+            "phase": [0.0, 120.0, 200.0, 45.0]}
+
+def test_put_load(tmp_path):
+    station = make_station()
+    with harmstore.HarmonicStore(tmp_path / "harms.sqlite", False) as store:
+        assert store.load("h551a") is None
+        store.put("h551a", station)
+        assert "h551a" in store and len(store) == 1
+        info, tide = store.load("h551a")
+
+    assert info == {key: station[key] for key in
+                    ("name", "country", "lat", "lon", "tzone")}
+    assert [c.name for c in tide.model['constituent']] == station['cons']
+    expected = processdata.reconstruct_tide_model({"h551a": station}, "h551a")
+    t = [datetime.datetime(2019, 1, 1, h) for h in range(24)]
+    np.testing.assert_allclose(tide.at(t), expected.at(t))
+
+    #replacing a station from a fitted model
+    with harmstore.HarmonicStore(tmp_path / "harms.sqlite", False) as store:
+        store.put("h551a", {"name": "Lyttelton"}, tide)
+        info, stored = store.load("h551a")
+        assert info == {"name": "Lyttelton"}
+        np.testing.assert_allclose(stored.model['amplitude'],
+                                   tide.model['amplitude'])
+        assert processdata.reconstruct_tide_model(store, "h000a") is None
+
+def test_put_atomic(tmp_path):
+    with harmstore.HarmonicStore(tmp_path / "harms.sqlite", False) as store:
+        store.put("h551a", make_station())
+        bad = dict(make_station(), cons = ["Z0", "M2", "S2", "XX"])
+        with pytest.raises(ValueError):
+            store.put("h551a", bad)
+        assert store.load("h551a")[0]["name"] == "Lyttelton"
+
+def test_migration(tmp_path):
+    legacy = tmp_path / "stations_harms.json"
+    legacy.write_text(json.dumps({"h551a": make_station(),
+                                  "h552a": {"meridian": "GMT"}}))
+    with harmstore.HarmonicStore(tmp_path / "harms.sqlite", legacy) as store:
+        assert store.codes() == ["h551a"]
+
+    connection = sqlite3.connect(str(tmp_path / "harms.sqlite"))
+    connection.execute("PRAGMA user_version = %i"
+                       % (harmstore.SCHEMA_VERSION + 1))
+    connection.close()
+    with pytest.raises(harmstore.SchemaError):
+        harmstore.HarmonicStore(tmp_path / "harms.sqlite", legacy)
+
+def test_default_paths(tmp_path, monkeypatch):
+    #the paths are read from constants when the store is opened
+    monkeypatch.setattr(constants, "HARMSTORE", tmp_path / "harms.sqlite")
+    monkeypatch.setattr(constants, "HARMFILE", tmp_path / "harms.json")
+    constants.HARMFILE.write_text(json.dumps({"h551a": make_station()}))
+    with harmstore.HarmonicStore() as store:
+        assert store.path == tmp_path / "harms.sqlite"
+        assert store.codes() == ["h551a"]
@@ -0,0 +1,57 @@
+import datetime
+
+import numpy as np
+
+from tidepredict import plotpng, timefunc
+from test_tide import make_tide
+
+STATION = {'name': "Lyttelton", 'country': "New Zealand",
+           'tzone': "Pacific/Auckland"}
+
+def test_sample():
+    tide = make_tide()
+    timeobj = timefunc.Tidetime(st_time = "2019-04-06 00:00",
+                                station_tz = "Pacific/Auckland")
+    times, heights, extrema_times, extrema_heights = plotpng.sample(tide,
+                                                                    timeobj)
+    assert len(times) == 2 * 240 + 1
+    assert times[0] == np.datetime64("2019-04-05T11:00")
+    expected = tide.at([timeobj.st_utc + datetime.timedelta(minutes = 6 * i)
+                        for i in range(len(times))])
+    assert np.allclose(heights, expected)
+    extrema = list(tide.extrema(timeobj.st_utc, timeobj.st_utc +
+                                datetime.timedelta(days = 2)))
+    assert (extrema_times == timefunc.utc_datetime64([e[0] for e in extrema])
+            ).all()
+    assert np.allclose(extrema_heights, [e[1] for e in extrema])
+
+def test_render(tmp_path):
+    tide = make_tide()
+    graph = plotpng.Graph()
+    for n, start in enumerate(["2019-04-06 00:00", "2019-10-01 12:00"]):
+        timeobj = timefunc.Tidetime(st_time = start,
+                                    station_tz = "Pacific/Auckland")
+        data = graph.render(tide, STATION, timeobj, tmp_path / ("%i.png" % n))
+        assert (tmp_path / ("%i.png" % n)).read_bytes()[:4] == b"\x89PNG"
+        #only the latest graph's labels are drawn
+        assert len(graph.ax.texts) == len(data[2])
+    plotpng.write_csv(*data, csvfile = tmp_path / "heights.csv",
+                      extrmfile = tmp_path / "extrema.csv")
+    lines = (tmp_path / "heights.csv").read_text().splitlines()
+    assert lines[0] == "DateTime,tide height in (m)"
+    assert lines[1] == "%i,%.3f" % (data[0][0].astype("datetime64[ms]")
+                                    .astype(np.int64), data[1][0])
+    assert len(lines) == len(data[0]) + 1
+    lines = (tmp_path / "extrema.csv").read_text().splitlines()
+    assert lines[0] == "DateTime,height"
+    assert len(lines) == len(data[2]) + 1
+
+def test_render_many(tmp_path):
+    tide = make_tide()
+    jobs = [(tide, STATION,
+             timefunc.Tidetime(st_time = "2019-10-%02i 00:00" % day,
+                               station_tz = "Pacific/Auckland"),
+             tmp_path / ("%i.png" % day)) for day in range(1, 5)]
+    paths = plotpng.render_many(jobs, processes = 2, days = 1)
+    assert paths == [str(job[3]) for job in jobs]
+    assert all(job[3].exists() for job in jobs)
@@ -7,6 +7,7 @@ from tidepredict import process_station_info
 from tidepredict import timefunc
 import pytz
 import datetime
+import numpy as np
 
 def test_time():
     fmt = "%Y-%m-%d %H:%M"
@@ -21,6 +22,15 @@ def test_time():
     
 
 
+def test_station_timezone():
+    from tidepredict import process_station_list
+    finder = timefunc.timezone_finder()
+    assert timefunc.timezone_finder() is finder
+    assert timefunc.station_timezone(-43.6, 172.7) == "Pacific/Auckland"
+    assert process_station_list.get_station_timezone("43-36S", "172-43E") \
+        == "Pacific/Auckland"
+    assert process_station_list.get_station_timezone("", "") == ""
+
 def test_get_data_url():
     assert processdata.get_data_url("indian") == "uhslc/rqds/indian"
     assert processdata.get_data_url("pacific") == "uhslc/rqds/pacific"
@@ -58,3 +68,93 @@ def test_deg_2_dec():
     assert process_station_info.deg_2_decimal("02-45S", "072-21W") == (-2.75, -72.35)
 
 
+
+def make_unhw_dat(days, values):
+    """Builds a University of Hawaii hourly .dat file"""
+    lines = [b"551LYTTELT 2019  LAT=43 36.2S  LONG=172 43.2E  TMZONE=GMT"]
+    for day, (first, second) in zip(days, values):
+        for half, row in ((1, first), (2, second)):
+            lines.append(("551LYTTELT %s%i" % (day.replace("-", ""), half)
+                        + "".join("%5i" % v for v in row)).encode())
+    return b"\n".join(lines) + b"\n"
+
+def test_parse_unhw_dat():
+    import numpy as np
+    first = [1000 + i for i in range(12)]
+    second = [9999] + [-20] + [2000 + i for i in range(10)]
+    raw = make_unhw_dat(["2019-12-31", "2020-01-01"],
+                        [(first, second), (second, first)])
+    times, heights, valid = processdata.parse_unhw_dat(raw)
+    assert times.dtype == np.dtype("datetime64[h]")
+    assert len(times) == len(heights) == len(valid) == 48
+    assert times[0] == np.datetime64("2019-12-31T00")
+    assert times[12] == np.datetime64("2019-12-31T12")
+    assert times[24] == np.datetime64("2020-01-01T00")
+    assert (np.diff(times) == np.timedelta64(1, "h")).all()
+    np.testing.assert_allclose(heights[:12], np.array(first) / 1000)
+    assert heights[13] == -0.02
+    assert not valid[12] and not valid[24] and valid.sum() == 46
+
+    with pytest.raises(ValueError):
+        processdata.parse_unhw_dat(raw.replace(b" 1005", b" 1x05"))
+
+def test_process_unhw_data(tmp_path):
+    import numpy as np
+    import zipfile
+    row = [1000 + i for i in range(12)]
+    archive = tmp_path / "h551a.zip"
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("h551a98.dat", make_unhw_dat(["1998-06-01"], [(row, row)]))
+        z.writestr("i551a19.dat", make_unhw_dat(["2019-06-01"], [(row, row)]))
+        z.writestr("readme.txt", "")
+    with zipfile.ZipFile(archive) as z:
+        assert processdata.unhw_members(z.namelist()) == {1998: "h551a98.dat",
+                                                          2019: "i551a19.dat"}
+
+    times, heights = processdata.process_unhw_data("", [98, 2019], "h551a",
+                                                   sio = archive)
+    assert len(times) == len(heights) == 48
+    assert times[0] == np.datetime64("1998-06-01T00")
+    assert times[-1] == np.datetime64("2019-06-01T23")
+
+def test_localise_array():
+    timeobj = timefunc.Tidetime(station_tz = "Pacific/Auckland")
+    start = datetime.datetime(2019, 1, 1, tzinfo = pytz.utc)
+    times = [start + datetime.timedelta(minutes = 37 * i, seconds = 13 * i)
+             for i in range(30000)]
+    local = timeobj.localise_array(timefunc.utc_datetime64(times))
+    expected = [timeobj.localise(t).strftime("%Y-%m-%dT%H:%M") for t in times]
+    assert np.datetime_as_string(local, unit = "m").tolist() == expected
+
+def test_write_plain(tmp_path):
+    from test_tide import make_tide
+    tide = make_tide()
+    station = {'name': "Lyttelton", 'country': "New Zealand",
+               'lat': -43.6, 'lon': 172.7}
+    timeobj = timefunc.Tidetime(st_time = "2019-03-01 00:00",
+                                en_time = "2019-05-01 00:00",
+                                station_tz = "Pacific/Auckland")
+    for form in ("t", "c"):
+        expected = ""
+        if form == "t":
+            expected = "Tide forecast for Lyttelton, New Zealand\n" \
+                       "Latitude:-43.60 Longitude:172.70\n"
+        for time, height, kind in tide.extrema(timeobj.st_utc,
+                                               timeobj.en_utc):
+            time = timeobj.localise(time)
+            if form == "c":
+                expected += "Lyttelton," + time.strftime("%Y-%m-%d,%H%M") \
+                            + ",Pacific/Auckland,"
+            else:
+                expected += time.strftime("%Y-%m-%d %H%M") \
+                            + " Pacific/Auckland"
+            expected += "%5.2f" % height + ("," if form == "c" else "")
+            expected += " Low Tide\n" if kind == "L" else " High Tide\n"
+        path = tmp_path / ("out." + form)
+        with open(path, "w", newline = "") as out:
+            count = processdata.write_plain(tide, station, form, timeobj, out,
+                                            chunk = 7)
+        assert count > 200
+        assert path.read_text() == expected
+        assert processdata.predict_plain(tide, station, form,
+                                         timeobj) == expected
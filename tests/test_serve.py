@@ -0,0 +1,114 @@
+import asyncio
+import datetime
+import json
+import sys
+
+import pytz
+
+from tidepredict import cache, harmstore, serve, stationindex
+
+def make_server(tmp_path):
+    index = stationindex.StationIndex(
+        [{"stat_idx": "551A", "oc_idx": "P", "loc_name": "Lyttelton",
+          "country": "New Zealand"},
+         {"stat_idx": "552A", "oc_idx": "P", "loc_name": "Lyttelton II",
+          "country": "New Zealand"}])
+    store = harmstore.HarmonicStore(tmp_path / "harms.sqlite", False)
+    store.put("h551a", {"name": "Lyttelton", "country": "New Zealand",
+                        "lat": -43.6, "lon": 172.7,
+                        "tzone": "Pacific/Auckland",
+                        "cons": ["Z0", "M2", "S2", "K1"],
+                        "amps": [1.5, 0.9, 0.1, 0.05],
+                        "phase": [0.0, 120.0, 200.0, 45.0]})
+    return serve.PredictionServer(index, store)
+
+QUERY = "station=Lyttelton&b=2019-10-01%2000:00&e=2019-10-01%2012:00"
+
+def test_respond(tmp_path):
+    server = make_server(tmp_path)
+    assert server.preload() == 1
+
+    status, body = server.respond("/extrema?" + QUERY)
+    assert status == 200
+    assert [e["type"] for e in body["extrema"]] == ["Low", "High"]
+    assert body["extrema"][0]["local"].startswith("2019-10-01")
+
+    status, body = server.respond("/heights?step=30&" + QUERY)
+    assert status == 200 and len(body["times"]) == len(body["heights"]) == 25
+    assert body["times"][0] == "2019-09-30T11:00Z"
+
+    status, body = server.respond("/text?f=c&" + QUERY.replace("Lyttelton",
+                                                               "h551a"))
+    assert status == 200
+    assert body["text"].splitlines()[0].startswith("Lyttelton,2019-10-01,")
+
+    assert server.respond("/stations?q=lytt")[1]["stations"][1]["code"] \
+        == "h552a"
+    assert server.respond("/extrema?station=h552a")[0] == 404
+    assert server.respond("/extrema?station=Nowhere")[0] == 404
+    #misspelt names are not served as another station
+    assert server.respond("/extrema?station=Littleton") \
+        == (404, {"error": "Station not found", "stations": ["Lyttelton"]})
+    assert server.respond("/extrema?station=Lytteltn")[0] == 404
+    assert server.respond("/extrema")[0] == 400
+    assert server.respond("/extrema?station=Lyttelton&b=tomorrow")[0] == 400
+    assert server.respond("/heights?step=0&" + QUERY)[0] == 400
+    assert server.respond("/tides")[0] == 404
+    server.store.close()
+
+def test_preload_cache(tmp_path):
+    server = make_server(tmp_path)
+    server.preload()
+    misses = cache.node_factors.info().misses
+    hits = cache.node_factors.info().hits
+    later = datetime.datetime.now(pytz.timezone("Pacific/Auckland")) \
+        + datetime.timedelta(days = 2)
+    query = "station=Lyttelton&b=" + later.strftime("%Y-%m-%d%%20%H:%M")
+    for target in ("/extrema?station=Lyttelton", "/extrema?" + query,
+                   "/heights?" + query,
+                   "/text?" + query):
+        assert server.respond(target)[0] == 200
+    assert cache.node_factors.info().misses == misses
+    assert cache.node_factors.info().hits > hits
+    server.store.close()
+
+async def get(reader, writer, target, close = False):
+    writer.write(("GET %s HTTP/1.1\r\nHost: localhost\r\n%s\r\n"
+                  % (target, "Connection: close\r\n" if close else ""))
+                 .encode())
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode().strip()
+        if not line:
+            break
+        key, _, value = line.partition(":")
+        headers[key.lower()] = value.strip()
+    body = await reader.readexactly(int(headers["content-length"]))
+    return status, json.loads(body)
+
+def test_serve(tmp_path):
+    server = make_server(tmp_path)
+
+    async def requests(**address):
+        listener = await serve.start(server, port = 0, **address)
+        async with listener:
+            if "socket" in address:
+                reader, writer = await asyncio.open_unix_connection(
+                    address["socket"])
+            else:
+                port = listener.sockets[0].getsockname()[1]
+                reader, writer = await asyncio.open_connection("127.0.0.1",
+                                                               port)
+            #several requests on one connection
+            status, body = await get(reader, writer, "/extrema?" + QUERY)
+            assert status == 200 and len(body["extrema"]) == 2
+            status, body = await get(reader, writer, "/nothing", close = True)
+            assert status == 404
+            assert await reader.read() == b""
+            writer.close()
+
+    asyncio.run(requests())
+    if sys.platform != "win32":
+        asyncio.run(requests(socket = str(tmp_path / "tidepredict.sock")))
+    server.store.close()
@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+
+from tidepredict import harmstore, stationindex
+
+#Modules which a text prediction must not import
+HEAVY = ["pandas", "matplotlib", "scipy", "timezonefinder", "jinja2"]
+#Budget for importing tidepredict.__main__, in seconds
+BUDGET = 1.0
+
+def test_startup(tmp_path):
+    home = tmp_path / ".tidepredict"
+    stationindex.StationIndex([{"stat_idx": "551A", "oc_idx": "P",
+                                "loc_name": "Lyttelton",
+                                "country": "New Zealand"}]) \
+        .save(home / "stations.idx")
+    with harmstore.HarmonicStore(home / "harmdata" / "stations_harms.sqlite",
+                                 False) as store:
+        store.put("h551a", {"name": "Lyttelton", "country": "New Zealand",
+                            "lat": -43.6, "lon": 172.7,
+                            "tzone": "Pacific/Auckland",
+                            "cons": ["Z0", "M2", "S2"],
+                            "amps": [1.5, 0.9, 0.1],
+                            "phase": [0.0, 120.0, 200.0]})
+
+    env = dict(os.environ, HOME = str(tmp_path),
+               PYTHONPATH = os.pathsep.join(sys.path))
+    result = subprocess.run([sys.executable, "-X", "importtime",
+                             "-m", "tidepredict", "-l", "Lyttelton",
+                             "-b", "2019-10-01 00:00",
+                             "-e", "2019-10-01 12:00"],
+                            env = env, cwd = str(tmp_path),
+                            capture_output = True, text = True, timeout = 60)
+    assert result.returncode == 0, result.stderr
+    assert "High Tide" in result.stdout
+
+    #top level imports are indented by one space, nested ones by more
+    imported = {}
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        imported[name.strip()] = int(cumulative) / 1e6
+        if len(name) - len(name.lstrip()) == 1:
+            total += int(cumulative) / 1e6
+    assert "tidepredict.processdata" in imported
+    for module in HEAVY:
+        assert module not in imported, "%s imported at startup" % module
+    assert total < BUDGET, "imports took %.3fs" % total
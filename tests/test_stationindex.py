@@ -0,0 +1,64 @@
+import csv
+
+from tidepredict import constants, stationindex
+
+def make_stations():
+    names = [("551A", "Lyttelton", "New Zealand"),
+             ("552A", "Lyttelton II", "New Zealand"),
+             ("057A", "Honolulu", "USA"),
+             ("290A", "Reykjavík", "Iceland"),
+             ("060A", "Port Louis", "Mauritius"),
+             ("061A", "Port-Louis Harbour", "Mauritius")]
+    return [{"stat_idx": code, "oc_idx": "P", "loc_name": name,
+             "country": country, "Lat": "43-36S", "Lon": "172-43E",
+             "data_years": "1901-2019", "Contributor": float("nan")}
+            for code, name, country in names]
+
+def names(stations):
+    return [station["loc_name"] for station in stations]
+
+def test_search():
+    index = stationindex.StationIndex(make_stations())
+    assert len(index) == 6
+    #a whole name match is preferred to the names containing it
+    assert names(index.search("lyttelton")) == ["Lyttelton"]
+    assert names(index.search("Lytt")) == ["Lyttelton", "Lyttelton II"]
+    assert names(index.search("olulu")) == ["Honolulu"]
+    assert names(index.search("reykjavik")) == ["Reykjavík"]
+    assert names(index.search("port louis")) == ["Port Louis"]
+    assert names(index.search("louis h")) == ["Port-Louis Harbour"]
+    #fuzzy matching
+    assert names(index.search("Honolullu")) == ["Honolulu"]
+    assert index.search("Honolullu", fuzzy = False) == []
+    #only a single very close name is taken for a misspelling
+    assert index.closest("Honolullu")["loc_name"] == "Honolulu"
+    assert index.closest("Reykjavk")["loc_name"] == "Reykjavík"
+    assert index.closest("Lytelton") is None
+    assert names(index.similar("Lytelton")) == ["Lyttelton", "Lyttelton II"]
+    assert names(index.similar("Honlu")) == ["Honolulu"]
+    assert index.closest("Honlu") is None
+    assert index.search("xyz") == [] and index.search("") == []
+    assert index.search("Honolulu")[0]["Contributor"] == ""
+
+def test_save_load(tmp_path, monkeypatch):
+    path = tmp_path / "stations.idx"
+    assert stationindex.StationIndex.load(path) is None
+    stationindex.StationIndex(make_stations()).save(path)
+    index = stationindex.StationIndex.load(path)
+    #the default path is read from constants when the index is saved
+    monkeypatch.setattr(constants, "STATIONINDEX", tmp_path / "default.idx")
+    index.save()
+    assert len(stationindex.StationIndex.load()) == len(index)
+    assert names(index.search("honolulu")) == ["Honolulu"]
+    assert list(index) == stationindex.StationIndex(make_stations()).stations
+
+    #built from stations.csv as written by create_station_dataframe
+    csvfile = tmp_path / "stations.csv"
+    with open(csvfile, "w", newline = "") as f:
+        writer = csv.DictWriter(f, ["", "x", "CI"] + stationindex.FIELDS)
+        writer.writeheader()
+        for i, station in enumerate(make_stations()):
+            writer.writerow(dict(station, **{"": i, "x": 1, "CI": "C",
+                                             "Contributor": ""}))
+    index = stationindex.StationIndex.from_csv(csvfile)
+    assert index.stations == stationindex.StationIndex(make_stations()).stations
@@ -0,0 +1,175 @@
+import copy
+import datetime
+import numpy as np
+import pandas as pd
+from tidepredict import astro, cache, constituent
+from tidepredict.tide import Tide, HarmonicAccumulator
+
+def test_astro_array():
+    times = [datetime.datetime(1990, 3, 1, 12, 0),
+             datetime.datetime(2019, 10, 1, 5, 30)]
+    values, speeds = astro.astro_array(np.array(times, dtype="datetime64[ns]"))
+    for i, t in enumerate(times):
+        a = astro.astro(t)
+        for name in astro.parameters:
+            assert np.isclose(values[name][i], a[name].value)
+            if a[name].speed is not None:
+                assert np.isclose(speeds[name][i], a[name].speed)
+
+def test_constituent_set():
+    times = [datetime.datetime(2001, 1, 1) + datetime.timedelta(days=97*i)
+             for i in range(5)]
+    cs = constituent.ConstituentSet.of(constituent.noaa)
+    assert constituent.ConstituentSet.of(constituent.noaa) is cs
+    #copies (e.g. unpickled models) share the set, which is bounded
+    assert constituent.ConstituentSet.of(copy.deepcopy(constituent.noaa)) is cs
+    compiled = constituent.ConstituentSet._compiled
+    maxsize = compiled.maxsize
+    try:
+        compiled.resize(4)
+        for n in range(1, 20):
+            constituent.ConstituentSet.of(constituent.noaa[:n])
+        assert len(compiled) == 4
+    finally:
+        compiled.resize(maxsize)
+    values, speeds = astro.astro_array(times)
+    a = astro.astro_parameters(values, speeds)
+    V, speed, u, f = cs.V(values), cs.speed(speeds), cs.u(a), cs.f(a)
+    for j, t in enumerate(times):
+        a_j = astro.astro(t)
+        for i, c in enumerate(constituent.noaa):
+            assert np.isclose(V[i, j], c.V(a_j))
+            assert np.isclose(speed[i, j], c.speed(a_j))
+            assert np.isclose(u[i, j], c.u(a_j))
+            assert np.isclose(f[i, j], c.f(a_j))
+
+def make_tide():
+    names = ["Z0", "M2", "S2", "N2", "K1", "O1", "M4"]
+    amps = [1.4, 1.0, 0.2, 0.25, 0.08, 0.05, 0.03]
+    phases = [0.0, 120.0, 150.0, 95.0, 200.0, 180.0, 30.0]
+    return Tide(constituents=[getattr(constituent, "_" + n) for n in names],
+                amplitudes=amps, phases=phases)
+
+def test_at_datetime64():
+    tide = make_tide()
+    times = pd.date_range("2019-10-01", periods=2000, freq="6min", tz="UTC")
+    expected = tide.at(times.to_pydatetime().tolist())
+    assert np.allclose(tide.at(times), expected)
+    assert np.allclose(tide.at(times.values.astype("datetime64[ns]")), expected)
+    epoch = times.values.astype("datetime64[ns]").astype(np.int64) / 1e9
+    assert np.allclose(tide.at(epoch), expected)
+
+def test_extrema():
+    tide = make_tide()
+    t0 = datetime.datetime(2019, 10, 1, tzinfo=datetime.timezone.utc)
+    extrema = list(tide.extrema(t0, t0 + datetime.timedelta(days=3)))
+    assert len(extrema) in (11, 12)
+    assert all(e0[2] != e1[2] for e0, e1 in zip(extrema, extrema[1:]))
+    step = datetime.timedelta(minutes=6)
+    for time, height, hilo in extrema:
+        before, after = tide.at([time - step, time + step])
+        sign = 1 if hilo == "H" else -1
+        assert sign*(height - before) > 0 and sign*(height - after) > 0
+    #heights agree with at(), and datetime64 times give the same extrema
+    assert np.allclose([e[1] for e in extrema],
+                       tide.at([e[0] for e in extrema]), atol=1e-3)
+    t64 = np.datetime64("2019-10-01T00:00", "us")
+    extrema64 = list(tide.extrema(t64, t64 + np.timedelta64(3, "D")))
+    assert [e[2] for e in extrema64] == [e[2] for e in extrema]
+    assert np.allclose([e[1] for e in extrema64], [e[1] for e in extrema])
+
+def test_node_factor_cache():
+    tide = make_tide()
+    times = pd.date_range("2031-01-01", periods=100, freq="h", tz="UTC")
+    cache.node_factors.clear()
+    first = tide.at(times)
+    misses = cache.node_factors.info().misses
+    assert misses > 0 and cache.node_factors.info().hits == 0
+    assert np.array_equal(tide.at(times), first)
+    assert cache.node_factors.info().misses == misses
+    assert cache.node_factors.info().hits > 0
+    #windows starting at other times share the node factors and arguments
+    times = times[:50]
+    for k in range(1, 4):
+        hits = cache.node_factors.info().hits
+        tide.at(times + pd.Timedelta(minutes=5*k))
+        assert cache.node_factors.info().misses == misses
+        assert cache.node_factors.info().hits > hits
+    start = datetime.datetime(2031, 1, 1, 6, tzinfo=datetime.timezone.utc)
+    list(tide.extrema(start, start + datetime.timedelta(days=3), tables=False))
+    misses = cache.node_factors.info().misses
+    for k in range(1, 4):
+        later = start + datetime.timedelta(minutes=5*k)
+        list(tide.extrema(later, later + datetime.timedelta(days=3),
+                          tables=False))
+        assert cache.node_factors.info().misses == misses
+    #V0 carried on from the cached grid point matches evaluating it directly
+    cs = constituent.ConstituentSet.of(tide.model['constituent'])
+    jd0 = astro.JD_array([later])[0]
+    values, speeds = astro.astro_array([jd0])
+    _, V0 = Tide._arguments(cs, jd0)
+    assert np.allclose((V0 - cs.V(values) + 180) % 360 - 180, 0, atol=1e-6)
+    lru = cache.LRUCache(maxsize=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    lru.get("a")
+    lru.put("c", 3)
+    assert "a" in lru and "b" not in lru and len(lru) == 2
+
+def test_decompose_linear():
+    tide = make_tide()
+    times = pd.date_range("2018-01-01", periods=24*90, freq="h", tz="UTC")
+    heights = tide.at(times)
+    constituents = tide.model["constituent"][1:]
+    linear = Tide.decompose(heights, times, constituents=constituents,
+                            method="linear")
+    nonlinear = Tide.decompose(heights, times, constituents=constituents)
+    assert np.allclose(linear.model["amplitude"], tide.model["amplitude"],
+                       atol=1e-2)
+    assert np.allclose(linear.model["amplitude"], nonlinear.model["amplitude"],
+                       atol=1e-6)
+    assert np.allclose(linear.model["phase"][1:], tide.model["phase"][1:],
+                       atol=0.5)
+
+def test_harmonic_accumulator(tmp_path):
+    tide = make_tide()
+    times = pd.date_range("2018-01-01", periods=24*90, freq="h", tz="UTC")
+    heights = tide.at(times)
+    constituents = tide.model["constituent"][1:]
+    whole = HarmonicAccumulator(times[0], constituents).add(heights, times)
+    chunked = HarmonicAccumulator(times[0], constituents)
+    chunked.add(heights[:1000], times[:1000]).save(tmp_path / "acc.npz")
+    resumed = HarmonicAccumulator.load(tmp_path / "acc.npz")
+    resumed.add(heights[1000:], times[1000:])
+    fit = whole.solve()
+    assert np.allclose(resumed.solve().model["amplitude"], fit.model["amplitude"])
+    assert np.allclose(fit.model["amplitude"], tide.model["amplitude"], atol=1e-3)
+
+def test_at_out_dtype():
+    tide = make_tide()
+    times = pd.date_range("2019-10-01", periods=24*60*15, freq="min", tz="UTC")
+    expected = tide.at(times.to_pydatetime().tolist())
+    out = np.zeros(len(times))
+    assert tide.at(times, out=out) is out
+    assert np.allclose(out, expected)
+    single = tide.at(times, dtype=np.float32)
+    assert single.dtype == np.float32
+    assert np.allclose(single, expected, atol=1e-5)
+
+def test_at_phasor():
+    tide = make_tide()
+    times = pd.date_range("2019-10-01", periods=24*10*20, freq="6min", tz="UTC")
+    assert Tide._uniform(Tide._hours(times.values[0], times.values))
+    assert np.allclose(tide.at(times), tide.at(times, uniform=False))
+    assert tide.phasor_error(times) < 1e-9
+
+def test_partition_error():
+    tide = make_tide()
+    t0 = datetime.datetime(2019, 1, 1, tzinfo=datetime.timezone.utc)
+    t1 = t0 + datetime.timedelta(days=30)
+    stepwise = tide.partition_error(t0, t1)
+    interpolated = tide.partition_error(t0, t1, interpolate=True)
+    assert interpolated.height < stepwise.height < 1e-3
+    assert stepwise.time < 0.01
+    coarse = tide.partition_error(t0, t1, extrema_partition=24000.0)
+    assert coarse.time > stepwise.time
@@ -1,17 +1,11 @@
 """Main routine for managing the program
 """
 from __future__ import print_function
-import numpy as np
 import sys
 import argparse
-from tidepredict import (processdata, process_station_list, constants,
-constituent, process_station_info, plotpng, timefunc)
-from tidepredict.tide import Tide
-import pandas as pd
-import json
-import datetime
-import timezonefinder
 import pathlib
+from tidepredict import (processdata, constants, timefunc, ftp_helpers,
+harmstore, stationindex, genharm, extrematable, export)
 
 __version__ = "0.4.3"
 
@@ -62,102 +56,251 @@ parser.add_argument('-e',
                     help = "end time for predictions",
                     metavar = "YYYY-MM-DD HH:MM")
 
+parser.add_argument('-offline',
+                    action="store_true",
+                    help="""Only use previously downloaded data files""")
+
+parser.add_argument('-o',
+                    action="store",
+                    help="""Write text or csv predictions to this file as
+                            they are generated rather than printing them
+                            when done, use - for standard output""",
+                    metavar="FILE")
+
+parser.add_argument('-export',
+                    action="store",
+                    help="""Export heights every -step minutes and the high
+                            and low tides from -b to -e in this format, to -o
+                            FILE or ~/.tidepredict/export/CODE.FORMAT. With
+                            -region, -country or -codes instead of a
+                            location every such station is exported, to the
+                            -o directory if given.""",
+                    choices=export.FORMATS)
+
+parser.add_argument('-step',
+                    action="store",
+                    type=float,
+                    help="""Minutes between exported heights. The default
+                            is 6.""",
+                    default=6)
+
+parser.add_argument('-tables',
+                    action="store",
+                    nargs=2,
+                    type=int,
+                    help="""Precompute the high and low tides of the
+                            location from the start of the first year to the
+                            end of the last, for faster predictions""",
+                    metavar=("FIRST", "LAST"))
+
+parser.add_argument('-region',
+                    action="store",
+                    help="""With -genharm and no location, generate
+                            harmonics for every station in an ocean region,
+                            or with -f p graph every such station""",
+                    choices=['pacific', 'indian', 'atlantic', 'all'])
+
+parser.add_argument('-country',
+                    action="append",
+                    help="""With -genharm and no location, generate
+                            harmonics for every station in a country, or
+                            with -f p graph them. May be repeated.""")
+
+parser.add_argument('-codes',
+                    action="store",
+                    nargs="+",
+                    help="""With -genharm and no location, generate
+                            harmonics for these station codes, or with -f p
+                            graph them""",
+                    metavar="CODE")
+
+parser.add_argument('-workers',
+                    action="store",
+                    type=int,
+                    help="""Number of processes used to fit harmonics or
+                            draw graphs in bulk. The default is one per
+                            core.""")
+
+parser.add_argument('-refit',
+                    action="store_true",
+                    help="""Fit stations again which are already in the
+                            harmonics store, rather than resuming""")
+
     #todo add the rest of the xtide arguments once I've implemented the above
     # correctly.   
 
 def process_args(args):
 
+    #generate harmonics in bulk for a region, countries or station codes
+    bulk = args.genharm and args.l == None and \
+        (args.region or args.country or args.codes)
+    #or draw graphs of them or export their predictions
+    many = args.l == None and not bulk and \
+        (args.region or args.country or args.codes)
+    graphs = many and args.f == "p"
+    exports = many and args.export
+
     #check we got at least one of location or list
-    if args.l == None and args.m != "l":
-        parser.error('Must enter a location or use list option [-m l]')
-
-    #First try to read in the location list
-    try:
-        stations = pd.read_csv(constants.STATIONFILE)
-        if args.r:
-            #force refresh of stations if command line arg is forced
-            raise EnvironmentError
-    except EnvironmentError:
-        #Not found then create it.
-        print("Refreshing stations list from online source.")
-        stations = process_station_list.create_station_dataframe()
+    if args.l == None and args.m != "l" and not (bulk or graphs or exports):
+        parser.error('Must enter a location or use list option [-m l] or '
+                     '-genharm, -f p or -export with -region, -country or '
+                     '-codes')
+    #exports are of one location or of the stations of a region
+    if args.export and args.l == None and not exports:
+        parser.error('-export needs a location or -region, -country or '
+                     '-codes')
 
-    #Run some checks on the requested station
-    if args.l != None:    #extract station data from stations df
-        thestation = stations[stations.loc_name.str.contains(args.l)]
-        #print(thestation)
-        if thestation.empty:
-            print("Station not found")
+    if args.offline:
+        ftp_helpers.offline = True
+
+    #Load the station search index, refreshing the station list if it is
+    #missing or the command line arg forces it
+    stations = stationindex.get_index(refresh = args.r)
+
+    if bulk:
+        selected = genharm.select_stations(stations, args.region,
+                                           args.country, args.codes)
+        if not selected:
+            print("No stations match the given region, country and codes")
             sys.exit()
-        if len(thestation) > 1:
+        with harmstore.HarmonicStore() as store:
+            failed = genharm.run(selected, store, __version__,
+                                 processes = args.workers,
+                                 resume = not args.refit)
+        return failed
+
+    if graphs or exports:
+        selected = genharm.select_stations(stations, args.region,
+                                           args.country, args.codes)
+        models = []
+        with harmstore.HarmonicStore() as store:
+            for thestation in selected:
+                loc_code = genharm.station_code(thestation)
+                record = store.load(loc_code)
+                if record is not None:
+                    models.append((loc_code,) + record)
+        if not models:
+            print("No harmonics found for the given region, country and codes")
+            print("Use option -genharm to generate harmonics for them")
+            sys.exit()
+        if len(models) < len(selected):
+            print("Skipping %i stations without harmonics"
+                  %(len(selected) - len(models)))
+
+    if exports:
+        directory = constants.EXPORTDIR if args.o is None else \
+            pathlib.Path(args.o)
+        directory.mkdir(parents = True, exist_ok = True)
+        paths = []
+        for loc_code, station, tide in models:
+            timeobj = timefunc.Tidetime(st_time = args.b,
+                                        en_time = args.e,
+                                        station_tz = station['tzone'])
+            path = directory / ("%s.%s" %(loc_code, args.export))
+            export.export(tide, station, timeobj.st_utc, timeobj.en_utc,
+                          args.step, path, args.export)
+            paths.append(path)
+        print("Exported %i stations to %s" %(len(paths), directory))
+        return paths
+
+    if graphs:
+        jobs = []
+        for loc_code, station, tide in models:
+            timeobj = timefunc.Tidetime(st_time = args.b,
+                                        station_tz = station['tzone'])
+            jobs.append((tide, station, timeobj,
+                         constants.GRAPHDIR / ("%s.png" %loc_code)))
+        from tidepredict import plotpng
+        constants.GRAPHDIR.mkdir(parents = True, exist_ok = True)
+        paths = plotpng.render_many(jobs, processes = args.workers)
+        print("Saved %i graphs to %s" %(len(paths), constants.GRAPHDIR))
+        return paths
+
+    #Run some checks on the requested station
+    if args.l != None:    #find the station in the station index
+        found = stations.search(args.l, fuzzy = False)
+        if not found:
+            #a misspelt name is only used if it can only mean one station,
+            #and the notice goes to stderr to keep csv output clean
+            closest = stations.closest(args.l)
+            if closest is None:
+                found = stations.similar(args.l)
+                print("Station not found")
+                if found:
+                    print("Did you mean one of these stations:")
+                    for item in found:
+                        print("%18s %16s"%(item['loc_name'], item['country']))
+                sys.exit()
+            print("Using closest match: %s"%closest['loc_name'],
+                  file = sys.stderr)
+            found = [closest]
+        if len(found) > 1:
             print("Station name ambiguous, the following stations were found:")
-            print(thestation)
+            for item in found:
+                print("%18s %16s"%(item['loc_name'], item['country']))
             sys.exit()
+        thestation = found[0]
 
-        loc_code = "h" + thestation.stat_idx.tolist()[0].lower()
-        station_dict, harmfileloc = process_station_list.read_station_info_file()
+        loc_code = genharm.station_code(thestation)
+        store = harmstore.HarmonicStore()
 
         if args.genharm is True:
-            #get the last two years that data exists for
-            lastyear = int(thestation.data_years.tolist()[0][-2:])
-            years = list(range(lastyear-1,lastyear+1))
-            #create data url
-            ocean = constants.ocean_dict[thestation.oc_idx.tolist()[0][0]]
-            ftpurl = processdata.get_data_url(ocean = ocean)
-            datadict = processdata.process_unhw_data(ftpurl = ftpurl,
-                                                    years=years,
-                                                    loc_code = loc_code)
-
-            my_tides = processdata.fit_model(datadict)
-
-            #get QA doc, returns a dict of dicts
-            process_station_info.get_station_info(loc_code, ocean, station_dict)
-            #set location data version for compatibility
-            station_dict[loc_code]['version'] = __version__
-            lat, lon = process_station_info.deg_2_decimal(thestation.Lat.tolist()[0],
-                                            thestation.Lon.tolist()[0])  
-            #write out the rest of the station information                                 
-            station_dict[loc_code]['lat'] = lat
-            station_dict[loc_code]['lon'] = lon
-            tf = timezonefinder.TimezoneFinder(in_memory=True)
-            station_dict[loc_code]['tzone'] = tf.timezone_at(lng=lon, lat=lat)
-            station_dict[loc_code]['name'] = thestation.loc_name.tolist()[0]
-            station_dict[loc_code]['country'] = thestation.country.tolist()[0]
-            station_dict[loc_code]['contributor'] = thestation.Contributor.tolist()[0]
-            station_dict[loc_code]['cons'] = [item.name for 
-                                            item in my_tides.model['constituent']]
-            station_dict[loc_code]['amps'] = my_tides.model['amplitude'].tolist()
-            station_dict[loc_code]['phase'] = my_tides.model['phase'].tolist()
-            
-            #if not constants.SAVEHARMLOCATION.exists():
-            #    constants.SAVEHARMLOCATION.mkdir()
-            #write to file.
-            harmfileloc.write_text(json.dumps(station_dict))
+            loc_code, station, my_tides = genharm.generate(thestation,
+                                                           __version__)
+            #write this station to the harmonics store.
+            store.put(loc_code, station, my_tides)
     
-        #Try to get the saved harmonics constants from file.
+        #Try to get the saved harmonics constants from the store.
         #Tide prediction using pre-generated constants is much faster than 
         #having to derive them again.
-        station_dict = json.loads(harmfileloc.read_text())
-        #Reconstruct tide model from saved harmonics data
-        tide = processdata.reconstruct_tide_model(station_dict, loc_code)
-        #print (tide.at([datetime(2019,1,1,0,0,0), datetime(2019,1,1,6,0,0)]))
-        if tide is None:
+        record = store.load(loc_code)
+        store.close()
+        if record is None:
             print("Harmonics data not found for %s" %args.l)
             print("Use option -genharm to generate harmonics for this location")
             sys.exit()
+        station, tide = record
+
+        if args.tables:
+            table = extrematable.build(tide, *args.tables)
+            print("Saved %i high and low tides for %i-%i"
+                  %(len(table), args.tables[0], args.tables[1]))
 
         #process start and end time arguments
         #check validity of start time
         timeobj = timefunc.Tidetime(st_time = args.b,
                                     en_time = args.e,
-                                    station_tz = station_dict[loc_code]['tzone'])
+                                    station_tz = station['tzone'])
         
     
+    if args.export:
+        if args.o is None:
+            constants.EXPORTDIR.mkdir(parents = True, exist_ok = True)
+            path = constants.EXPORTDIR / ("%s.%s" %(loc_code, args.export))
+        else:
+            path = pathlib.Path(args.o)
+        heights, extrema = export.export(tide, station, timeobj.st_utc,
+                                         timeobj.en_utc, args.step, path,
+                                         args.export)
+        print("Exported %i heights to %s and %i high and low tides to %s"
+              %(heights, path, extrema, export.extrema_path(path)))
+        return path
+
     #output tide predictions depending on options specified.
     if args.m == "p" and (args.f == "t" or args.f == "c"):
+        if args.o is not None:
+            #stream to the file, output of any length uses constant memory
+            if args.o == "-":
+                processdata.write_plain(tide, station, args.f, timeobj,
+                                        sys.stdout)
+            else:
+                with open(args.o, "w", newline = "") as out:
+                    processdata.write_plain(tide, station, args.f, timeobj,
+                                            out)
+            return None
         #Text output
         predictions = processdata.predict_plain(tide,
-                                                station_dict[loc_code],
+                                                station,
                                                 args.f,
                                                 timeobj)
         print(predictions)
@@ -165,20 +308,24 @@ def process_args(args):
 
     elif args.m == "l":
         #list all available stations name and country
-        for name, country, lat, lon in zip(stations['loc_name'], 
-                                stations['country'],
-                                stations['Lat'],
-                                stations['Lon']):
-            print("%18s %16s %8s %8s"%(name, country, lat, lon))
+        for item in stations:
+            print("%18s %16s %8s %8s"%(item['loc_name'], item['country'],
+                                       item['Lat'], item['Lon']))
 
     if args.f == "p":
-        #PNG output
+        #PNG output, matplotlib is only imported for graphs
+        from tidepredict import plotpng
         png = plotpng.Plotpng(tide,
-                      station_dict[loc_code],
+                      station,
                       args.f,
                       timeobj)
     
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["serve"]:
+        #long running server, see tidepredict.serve
+        from tidepredict import serve
+        serve.main(sys.argv[2:])
+        sys.exit()
     args = parser.parse_args()
     #print(args.harmgen)
     process_args(args)
@@ -1,4 +1,4 @@
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 import numpy as np
 d2r, r2d = np.pi/180.0, 180.0/np.pi
 
@@ -26,6 +26,17 @@ def polynomial(coefficients, argument):
 def d_polynomial(coefficients, argument):
 	return sum([c * i * (argument ** (i-1)) for i,c in enumerate(coefficients)])
 
+#Evaluate a polynomial at an argument (or array of arguments) by Horner's rule
+def horner(coefficients, argument):
+	result = np.zeros(np.shape(argument))
+	for c in reversed(coefficients):
+		result = result * argument + c
+	return result
+
+#Evaluate the first derivative of a polynomial by Horner's rule
+def d_horner(coefficients, argument):
+	return horner([c * i for i,c in enumerate(coefficients)][1:], argument)
+
 #Meeus formula 11.1
 def T(t):
 	return (JD(t) - 2451545.0)/36525
@@ -47,6 +58,21 @@ def JD(t):
 	B = 2 - A + np.floor(A / 4.0)
 	return np.floor(365.25*(Y+4716)) + np.floor(30.6001*(M+1)) + D + B - 1524.5
 
+#Julian Date of the Unix epoch, 1970-01-01T00:00
+JD_EPOCH = 2440587.5
+
+#Julian Dates for an array of times.  Accepts numpy datetime64 (taken as UTC),
+#floats (taken to be Julian Dates already) or datetimes.
+def JD_array(t):
+	t = np.asarray(t)
+	if t.dtype.kind == 'M':
+		ns = (t - np.datetime64(0, 'ns')).astype('timedelta64[ns]').astype(np.int64)
+		days, ns = np.divmod(ns, 86400 * 10**9)
+		return JD_EPOCH + days + ns / (86400.0 * 1e9)
+	elif t.dtype.kind == 'O':
+		return np.vectorize(JD, otypes=[float])(t)
+	return t.astype(float)
+
 #Meeus formula 21.3
 terrestrial_obliquity_coefficients = (
 	s2d(23,26,21.448),
@@ -154,55 +180,83 @@ def _nupp(N, i, omega):
 
 AstronomicalParameter = namedtuple('AstronomicalParameter', ['value', 'speed'])
 
-def astro(t):
-	a = {}
-	#We can use polynomial fits from Meeus to obtain good approximations to
-	#some astronomical values (and therefore speeds).
-	polynomials = {
-			's':     lunar_longitude_coefficients,
-			'h':     solar_longitude_coefficients,
-			'p':     lunar_perigee_coefficients,
-			'N':     lunar_node_coefficients,
-			'pp':    solar_perigee_coefficients,
-			'90':    (90.0,),
-			'omega': terrestrial_obliquity_coefficients,
-			'i':     lunar_inclination_coefficients
-	}
+#Polynomial fits from Meeus from which we obtain good approximations to some
+#astronomical values (and therefore speeds).
+polynomials = OrderedDict([
+	('s',     lunar_longitude_coefficients),
+	('h',     solar_longitude_coefficients),
+	('p',     lunar_perigee_coefficients),
+	('N',     lunar_node_coefficients),
+	('pp',    solar_perigee_coefficients),
+	('90',    (90.0,)),
+	('omega', terrestrial_obliquity_coefficients),
+	('i',     lunar_inclination_coefficients)
+])
+
+#Parameters defined by Schureman which are dependent on N, i, omega for use in
+#node factor calculations. We don't need their speeds.
+auxiliaries = OrderedDict([
+	('I',    _I),
+	('xi',   _xi),
+	('nu',   _nu),
+	('nup',  _nup),
+	('nupp', _nupp)
+])
+
+#Fields of the structured arrays returned by astro_array
+parameters = list(polynomials) + list(auxiliaries) + ['P', 'T+h-s']
+astro_dtype = np.dtype([(name, float) for name in parameters])
+
+def astro_array(t):
+	"""
+	Return the astronomical parameters at an array of times in one pass.
+	Arguments:
+	t -- array of numpy datetime64 (UTC), Julian Dates or datetimes
+	Returns a pair of structured arrays (of dtype astro_dtype and the shape of
+	t) holding the values in degrees and the speeds in degrees per hour.  The
+	speeds of the auxiliary parameters are not needed and are NaN.
+	"""
+	jd = JD_array(t)
+	values = np.zeros(jd.shape, dtype=astro_dtype)
+	speeds = np.full(jd.shape, np.nan, dtype=astro_dtype)
 	#Polynomials are in T, that is Julian Centuries; we want our speeds to be
 	#in the more convenient unit of degrees per hour.
+	T = (jd - 2451545.0)/36525
 	dT_dHour = 1 / (24 * 365.25 * 100)
 	for name, coefficients in polynomials.items():
-		a[name] = AstronomicalParameter(
-				np.mod(polynomial(coefficients, T(t)), 360.0),
-				d_polynomial(coefficients, T(t)) * dT_dHour
-		)
+		values[name] = np.mod(horner(coefficients, T), 360.0)
+		speeds[name] = d_horner(coefficients, T) * dT_dHour
 
-	#Some other parameters defined by Schureman which are dependent on the
-	#parameters N, i, omega for use in node factor calculations. We don't need
-	#their speeds.
-	args = list(each.value for each in [a['N'], a['i'], a['omega']])
-	for name, function in {
-		'I':    _I,
-		'xi':   _xi,
-		'nu':   _nu,
-		'nup':  _nup,
-		'nupp': _nupp
-	}.items():
-		a[name] = AstronomicalParameter(np.mod(function(*args), 360.0), None)
+	args = [values['N'], values['i'], values['omega']]
+	for name, function in auxiliaries.items():
+		values[name] = np.mod(function(*args), 360.0)
 
 	#We don't work directly with the T (hours) parameter, instead our spanning
 	#set for equilibrium arguments #is given by T+h-s, s, h, p, N, pp, 90.
 	#This is in line with convention.
-	hour = AstronomicalParameter((JD(t) - np.floor(JD(t))) * 360.0, 15.0)
-	a['T+h-s'] = AstronomicalParameter(
-		hour.value + a['h'].value - a['s'].value,
-		hour.speed + a['h'].speed - a['s'].speed
-	)
+	values['T+h-s'] = (jd - np.floor(jd)) * 360.0 + values['h'] - values['s']
+	speeds['T+h-s'] = 15.0 + speeds['h'] - speeds['s']
 	#It is convenient to calculate Schureman's P here since several node
 	#factors need it, although it could be argued that these
 	#(along with I, xi, nu etc) belong somewhere else.
-	a['P'] = AstronomicalParameter(
-		np.mod(a['p'].value -a['xi'].value,360.0),
-		None
-	)
-	return a
+	values['P'] = np.mod(values['p'] - values['xi'], 360.0)
+	return values, speeds
+
+def astro_parameters(values, speeds):
+	"""
+	Convert the structured arrays returned by astro_array into the dictionary
+	of AstronomicalParameter used by constituents and node factors.  The
+	values of the parameters are arrays when values is not a scalar.
+	"""
+	return {
+		name: AstronomicalParameter(
+			values[name],
+			None if name in auxiliaries or name == 'P' else speeds[name]
+		)
+		for name in parameters
+	}
+
+def astro(t):
+	values, speeds = astro_array([t])
+	values, speeds = values[0], speeds[0]
+	return astro_parameters(values, speeds)
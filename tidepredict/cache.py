@@ -0,0 +1,75 @@
+"""
+In-memory caches shared across the module
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+class LRUCache:
+    """A thread-safe mapping with a size limit which evicts the least
+    recently used entries, and counts hits and misses.
+    """
+
+    def __init__(self, maxsize = 128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default = None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._evict()
+
+    def resize(self, maxsize):
+        """Change the size limit, evicting entries if necessary"""
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        """Remove all entries and reset the counters"""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def _evict(self):
+        while len(self._data) > max(self.maxsize, 0):
+            self._data.popitem(last = False)
+
+#Node factors (u, f) and equilibrium arguments (speed, V0) prepared by
+#tide.Tide._prepare, keyed by constituent names and a point of a grid of
+#Julian Dates, so that windows starting at different times share them.
+node_factors = LRUCache(maxsize = 8192)
+#Hours between the times equilibrium arguments are cached at, V0 at any
+#other time is carried on from the nearest at the constituent speeds
+V0_GRID = 24.0
+#Most hours between the times node factors are evaluated at, for a
+#partition they are evaluated at most a tenth of the partition apart
+UF_GRID = 24.0
+#Resolution in days of the times node factors are evaluated at when no
+#partition is given (about 1 ms)
+JD_QUANTUM = 1e-8
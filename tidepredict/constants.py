@@ -13,14 +13,32 @@ HOME = pathlib.Path.home()
 SAVEFILELOCATION = HOME / ".tidepredict" 
 #stations csv file
 STATIONFILE = SAVEFILELOCATION / "stations.csv"
+#stations search index
+STATIONINDEX = SAVEFILELOCATION / "stations.idx"
 #saveharmdata location
 SAVEHARMLOCATION = HOME / SAVEFILELOCATION / "harmdata"
+#legacy harmonics json file, migrated into the harmonics store
+HARMFILE = SAVEHARMLOCATION / "stations_harms.json"
+#harmonics store
+HARMSTORE = SAVEHARMLOCATION / "stations_harms.sqlite"
 #graph file
 GRAPHFILE = SAVEFILELOCATION / "tidegraph.png"
+#graphs of many stations
+GRAPHDIR = SAVEFILELOCATION / "graphs"
+#exported predictions
+EXPORTDIR = SAVEFILELOCATION / "export"
 #csv data
 CSVFILE = SAVEFILELOCATION / "tidegraph.csv"
 #extrema csv file
 EXTRMFILE = SAVEFILELOCATION / "extrema.csv"    
+#precomputed extrema tables
+EXTREMADIR = SAVEFILELOCATION / "extrema"
+#downloaded file cache
+FTPCACHE = SAVEFILELOCATION / "ftpcache"
+#size limit of the download cache in bytes
+FTPCACHE_SIZE = 1024**3
+#number of files downloaded concurrently
+FTP_WORKERS = 4
 #ocean dict
 ocean_dict = {'P':"pacific","I":"indian","A":"atlantic"}
 #ftp base address
@@ -3,6 +3,7 @@ import string
 import operator as op
 import numpy as np
 from tidepredict import nodal_corrections as nc
+from tidepredict import cache
 
 class BaseConstituent(object):
 	xdo_int = {
@@ -81,6 +82,98 @@ class CompoundConstituent(BaseConstituent):
 	def f(self, a):
 		return reduce(op.mul, [c.f(a) ** abs(n) for (c,n) in self.members])
 
+class ConstituentSet(object):
+	"""
+	A precompiled set of constituents for evaluating equilibrium arguments,
+	speeds and node factors of every constituent at once.  V and speed are a
+	product with the matrix of Doodson coefficients; u and f are evaluated once
+	per nodal correction family (the distinct u, f pairs of the base
+	constituents) and combined with the family coefficients of each
+	constituent.
+	"""
+	astro_xdo = ['T+h-s', 's', 'h', 'p', 'N', 'pp', '90']
+
+	#Compiled sets by constituent names, bounded as every distinct list of
+	#constituents (such as each station's) would otherwise be kept forever
+	_compiled = cache.LRUCache(maxsize = 256)
+
+	def __init__(self, constituents):
+		self.constituents = list(constituents)
+		self.key = tuple(c.name for c in self.constituents)
+		self.coefficients = np.array([c.coefficients for c in self.constituents], dtype=float)
+		families = []
+		members = [self._members(c) for c in self.constituents]
+		for c_members in members:
+			for (u, f), _ in c_members:
+				if (u, f) not in families:
+					families.append((u, f))
+		self.families = families
+		#The node factors of a compound constituent are u = sum(n*u_i) and
+		#f = prod(f_i**|n|) over its members.
+		self.u_coefficients = np.zeros((len(self.constituents), len(families)))
+		self.f_exponents = np.zeros((len(self.constituents), len(families)))
+		for i, c_members in enumerate(members):
+			for family, n in c_members:
+				j = families.index(family)
+				self.u_coefficients[i, j] += n
+				self.f_exponents[i, j] += abs(n)
+
+	@classmethod
+	def of(cls, constituents):
+		"""
+		Return the (memoised) ConstituentSet for a sequence of constituents.
+		"""
+		key = tuple(c.name for c in constituents)
+		compiled = cls._compiled.get(key)
+		if compiled is None:
+			compiled = cls(constituents)
+			cls._compiled.put(key, compiled)
+		return compiled
+
+	@staticmethod
+	def _members(c, n = 1):
+		#Expand a constituent into ((u, f), n) pairs of its base members,
+		#unless it has been given node factors of its own.
+		if (isinstance(c, CompoundConstituent)
+				and getattr(c.u, '__func__', None) is CompoundConstituent.u
+				and getattr(c.f, '__func__', None) is CompoundConstituent.f):
+			return [each for (m, k) in c.members for each in ConstituentSet._members(m, n*k)]
+		return [((c.u, c.f), n)]
+
+	def __len__(self):
+		return len(self.constituents)
+
+	def _xdo(self, a):
+		return np.array([a[name] for name in self.astro_xdo])
+
+	def V(self, values):
+		"""
+		Equilibrium arguments (N, M) given the values returned by astro_array.
+		"""
+		return np.dot(self.coefficients, self._xdo(values))
+
+	def speed(self, speeds):
+		"""
+		Speeds (N, M) given the speeds returned by astro_array.
+		"""
+		return np.dot(self.coefficients, self._xdo(speeds))
+
+	def _family(self, a, index):
+		shape = a['N'].value.shape
+		return np.array([np.broadcast_to(family[index](a), shape) for family in self.families])
+
+	def u(self, a):
+		"""
+		Node factors u (N, M) given astro_parameters over M times.
+		"""
+		return np.dot(self.u_coefficients, self._family(a, 0))
+
+	def f(self, a):
+		"""
+		Node factors f (N, M) given astro_parameters over M times.
+		"""
+		return np.exp(np.dot(self.f_exponents, np.log(self._family(a, 1))))
+
 ###### Base Constituents
 #Long Term
 _Z0      = BaseConstituent(name = 'Z0',      xdo = 'Z ZZZ ZZZ', u = nc.u_zero, f = nc.f_unity)
@@ -0,0 +1,222 @@
+"""
+Binary export of predicted heights and high and low tides.
+
+Series are written as columns of UTC times and heights in metres, with
+metadata giving the station, timezone, datum and model hash (see
+extrematable.model_hash) in one of the FORMATS:
+
+npy -- a .npy file, next to a .json file of the metadata. Heights are
+       stored alone, their times are the start and step in the metadata.
+       Extrema are a structured array of time, height and type.
+arrow -- an Arrow IPC file with the metadata in its schema
+parquet -- a Parquet file with the metadata in its schema
+
+Heights are predicted CHUNK at a time by Tide.at straight into the output
+buffer, for npy a memory mapped file, so memory use stays the same however
+long the series. Arrow and Parquet need pyarrow, which is only imported
+when they are used.
+"""
+import datetime
+import json
+import pathlib
+
+import numpy as np
+
+from tidepredict import extrematable, timefunc
+
+FORMATS = ("npy", "arrow", "parquet")
+#number of heights predicted and written at a time
+CHUNK = 1 << 18
+#heights of the UHSLC hourly data are relative to the station zero
+DATUM = "station zero"
+#key of the metadata in Arrow and Parquet schemas
+METAKEY = "tidepredict"
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("pyarrow is needed to export Arrow and Parquet "
+                          "files, install it or export as npy")
+    return pyarrow
+
+def _utc64(t):
+    """A datetime or datetime64 as a UTC datetime64[ms]"""
+    if not isinstance(t, np.datetime64):
+        t = timefunc.utc_datetime64([t])[0]
+    return t.astype("datetime64[ms]")
+
+def _step64(step):
+    """A step in minutes, timedelta or timedelta64 as a timedelta64[ms]"""
+    if isinstance(step, (np.timedelta64, datetime.timedelta)):
+        return np.timedelta64(step).astype("timedelta64[ms]")
+    return np.timedelta64(int(round(step * 60000)), "ms")
+
+def metadata(tide, station = None, **extra):
+    """Returns the metadata of an export of tide at station, a station
+    information dictionary of the harmonics store
+    """
+    station = station or {}
+    meta = {"station": station.get('name', ""),
+            "country": station.get('country', ""),
+            "lat": station.get('lat'),
+            "lon": station.get('lon'),
+            "timezone": station.get('tzone', ""),
+            "datum": station.get('datum', DATUM),
+            "units": "m",
+            "times": "UTC",
+            "model": extrematable.model_hash(tide)}
+    meta.update(extra)
+    return meta
+
+def sidecar(path):
+    """Path of the metadata file of a npy export"""
+    path = pathlib.Path(path)
+    return path.with_name(path.name + ".json")
+
+def extrema_path(path):
+    """Path the extrema are exported to alongside heights exported to path"""
+    path = pathlib.Path(path)
+    return path.with_name(path.stem + "_extrema" + path.suffix)
+
+def _write_sidecar(path, meta):
+    with open(sidecar(path), "w") as f:
+        json.dump(meta, f, indent = 1)
+
+def _table_writer(path, format, schema):
+    """Opens an Arrow IPC or Parquet writer of record batches"""
+    pa = _pyarrow()
+    if format == "arrow":
+        return pa.ipc.new_file(str(path), schema)
+    if format == "parquet":
+        return pa.parquet.ParquetWriter(str(path), schema)
+    raise ValueError("format must be one of: %s" % ", ".join(FORMATS))
+
+def _schema(fields, meta):
+    return _pyarrow().schema(fields,
+                             metadata = {METAKEY: json.dumps(meta)})
+
+def write_heights(tide, start, end, step, path, format = "npy",
+                  station = None, dtype = np.float32, chunk = CHUNK):
+    """Predicts and writes heights every step from start until end.
+
+    start, end: datetimes (naive times are UTC) or datetime64 (UTC)
+    step: minutes, timedelta or timedelta64
+    format: one of FORMATS
+    station: station information recorded in the metadata
+    dtype: dtype of the heights
+    chunk: number of heights predicted and written at a time
+
+    Returns the number of heights written.
+    """
+    start, end, step = _utc64(start), _utc64(end), _step64(step)
+    if not step > np.timedelta64(0, "ms"):
+        raise ValueError("step must be positive")
+    count = max(0, int((end - start) // step) + 1)
+    dtype = np.dtype(dtype)
+    meta = metadata(tide, station, kind = "heights",
+                    start = str(start) + "Z",
+                    step_ms = int(step.astype(np.int64)), count = count,
+                    dtype = dtype.str)
+
+    def chunks(buffer):
+        """Yields the times and heights of each chunk, predicted into
+        buffer
+        """
+        for i in range(0, count, chunk):
+            n = min(chunk, count - i)
+            times = start + step * np.arange(i, i + n)
+            yield times, tide.at(times, out = buffer(i, n))
+
+    if format == "npy":
+        heights = np.lib.format.open_memmap(path, mode = "w+", dtype = dtype,
+                                            shape = (count,))
+        for _ in chunks(lambda i, n: heights[i:i + n]):
+            pass
+        heights.flush()
+        del heights
+        _write_sidecar(path, meta)
+        return count
+
+    pa = _pyarrow()
+    schema = _schema([("time", pa.timestamp("ms", tz = "UTC")),
+                      ("height", pa.from_numpy_dtype(dtype))], meta)
+    buffer = np.empty(min(chunk, count), dtype = dtype)
+    with _table_writer(path, format, schema) as writer:
+        for times, heights in chunks(lambda i, n: buffer[:n]):
+            #batches are written out before the buffer is reused
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(times, type = schema.field("time").type),
+                 pa.array(heights)], schema = schema))
+    return count
+
+def write_extrema(tide, start, end, path, format = "npy", station = None):
+    """Writes the high and low tides between start and end.
+
+    Columns are the time, height and type (H or L) of each. Returns the
+    number of extrema written.
+    """
+    start, end = _utc64(start), _utc64(end)
+    utc = datetime.timezone.utc
+    extrema = list(tide.extrema(
+        start.astype(datetime.datetime).replace(tzinfo = utc),
+        end.astype(datetime.datetime).replace(tzinfo = utc)))
+    times = timefunc.utc_datetime64([e[0] for e in extrema]) \
+        .astype("datetime64[ms]")
+    heights = np.array([e[1] for e in extrema], dtype = np.float32)
+    kinds = np.array([e[2] for e in extrema], dtype = "S1")
+    meta = metadata(tide, station, kind = "extrema",
+                    start = str(start) + "Z", end = str(end) + "Z",
+                    count = len(extrema))
+
+    if format == "npy":
+        table = np.empty(len(extrema), dtype = [("time", "<M8[ms]"),
+                                                ("height", "<f4"),
+                                                ("type", "S1")])
+        table["time"], table["height"], table["type"] = times, heights, kinds
+        #saved to exactly path, np.save would add .npy to other names
+        with open(path, "wb") as f:
+            np.save(f, table)
+        _write_sidecar(path, meta)
+        return len(extrema)
+
+    pa = _pyarrow()
+    schema = _schema([("time", pa.timestamp("ms", tz = "UTC")),
+                      ("height", pa.float32()),
+                      ("type", pa.string())], meta)
+    with _table_writer(path, format, schema) as writer:
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(times, type = schema.field("time").type),
+             pa.array(heights), pa.array(kinds.astype(str))],
+            schema = schema))
+    return len(extrema)
+
+def export(tide, station, start, end, step, path, format = "npy",
+           dtype = np.float32, chunk = CHUNK):
+    """Exports heights every step to path and the extrema between start and
+    end to extrema_path(path). Returns the numbers of each written.
+    """
+    if format not in FORMATS:
+        raise ValueError("format must be one of: %s" % ", ".join(FORMATS))
+    return (write_heights(tide, start, end, step, path, format, station,
+                          dtype, chunk),
+            write_extrema(tide, start, end, extrema_path(path), format,
+                          station))
+
+def load(path):
+    """Loads a npy export, memory mapped.
+
+    Returns a dictionary of its columns (time, height and, for extrema,
+    type) and the metadata.
+    """
+    with open(sidecar(path)) as f:
+        meta = json.load(f)
+    data = np.load(path, mmap_mode = "r")
+    if meta.get("kind") == "heights":
+        start = np.datetime64(meta["start"].rstrip("Z"), "ms")
+        times = start + np.timedelta64(meta["step_ms"], "ms") \
+            * np.arange(len(data))
+        return {"time": times, "height": data}, meta
+    return {name: data[name] for name in data.dtype.names}, meta
@@ -0,0 +1,164 @@
+"""
+Precomputed tables of high and low tides.
+
+The extrema of a model never change, so they can be found once for a range
+of years and saved. Tables are keyed by a hash of the model (constituents,
+amplitudes, phases and the Tide settings which affect extrema) and saved
+under constants.EXTREMADIR as .npz files of
+
+times -- int64 microseconds since 1970-01-01 UTC
+heights -- float32
+flags -- b'H' or b'L'
+span -- int64 microseconds of the start and end of the period covered
+
+Tide.extrema uses a table transparently whenever one covers the requested
+period, so looking up any window is a binary search and a slice.
+"""
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from tidepredict import constants
+
+#Version of the table format, part of the hash
+FORMAT = 1
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_UTC = _EPOCH.replace(tzinfo = datetime.timezone.utc)
+#Loaded tables and their modification times by path
+_tables = {}
+
+def model_hash(tide):
+    """Returns a hash of everything which determines the extrema of tide"""
+    h = hashlib.sha256()
+    h.update(json.dumps([FORMAT,
+                         [c.name for c in tide.model['constituent']],
+                         float(tide.partition), float(tide.extrema_partition),
+                         bool(tide.interpolate)]).encode())
+    for field in ('amplitude', 'phase'):
+        h.update(np.ascontiguousarray(tide.model[field], dtype = '<f8')
+                 .tobytes())
+    return h.hexdigest()
+
+def micros(t):
+    """Microseconds since 1970-01-01 UTC of a datetime or datetime64.
+    Naive datetimes are taken to be UTC.
+    """
+    if isinstance(t, np.datetime64):
+        return int(t.astype('datetime64[us]').astype(np.int64))
+    delta = t - (_EPOCH if t.tzinfo is None else _EPOCH_UTC)
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+class ExtremaTable:
+    """The extrema of a model over a period"""
+
+    def __init__(self, times, heights, flags, span):
+        self.times = np.asarray(times, dtype = np.int64)
+        self.heights = np.asarray(heights, dtype = np.float32)
+        self.flags = np.asarray(flags, dtype = 'S1')
+        self.span = np.asarray(span, dtype = np.int64)
+
+    @classmethod
+    def compute(cls, tide, start, end):
+        """Finds the extrema of tide between two datetimes"""
+        times, heights, flags = [], [], []
+        for time, height, flag in tide.extrema(start, end, tables = False):
+            times.append(micros(time))
+            heights.append(height)
+            flags.append(flag)
+        return cls(times, heights, flags, [micros(start), micros(end)])
+
+    def covers(self, t0, t1):
+        return self.span[0] <= micros(t0) and micros(t1) <= self.span[1]
+
+    def between(self, t0, t1):
+        """Yields the extrema after t0 and before t1 as Tide.extrema does"""
+        us0 = micros(t0)
+        lo = np.searchsorted(self.times, us0, side = 'right')
+        hi = np.searchsorted(self.times, micros(t1), side = 'left')
+        offsets = (self.times[lo:hi] - us0).tolist()
+        heights = self.heights[lo:hi].astype(np.float64)
+        flags = self.flags[lo:hi]
+        if isinstance(t0, np.datetime64):
+            t0 = t0.astype('datetime64[us]')
+            times = [t0 + np.timedelta64(offset, 'us') for offset in offsets]
+        else:
+            times = [t0 + datetime.timedelta(microseconds = offset)
+                     for offset in offsets]
+        for time, height, flag in zip(times, heights, flags):
+            yield (time, height, 'H' if flag == b'H' else 'L')
+
+    def save(self, path):
+        path.parent.mkdir(parents = True, exist_ok = True)
+        fd, tmp = tempfile.mkstemp(dir = path.parent, suffix = ".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            np.savez(fh, times = self.times, heights = self.heights,
+                     flags = self.flags, span = self.span)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['times'], data['heights'], data['flags'],
+                       data['span'])
+
+    def __len__(self):
+        return len(self.times)
+
+def table_path(key, directory = None):
+    return (constants.EXTREMADIR if directory is None else directory) \
+        / ("%s.npz" % key)
+
+def get_table(tide, directory = None):
+    """Returns the saved table of a model, or None if there isn't one"""
+    key = model_hash(tide)
+    path = table_path(key, directory)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    cached = _tables.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = mtime, ExtremaTable.load(path)
+        _tables[path] = cached
+    return cached[1]
+
+def _utc(t):
+    """Whether t is a datetime64, naive or UTC time"""
+    return isinstance(t, np.datetime64) or t.utcoffset() in (None,
+                                                              _EPOCH - _EPOCH)
+
+def find(tide, t0, t1, directory = None):
+    """Returns a saved table of tide covering t0 to t1, or None.
+
+    Tide evaluates the astronomical arguments of aware times from their
+    local fields, so tables are only used for UTC (or naive) times where
+    they give the same extrema as Tide.extrema.
+    """
+    if not (_utc(t0) and _utc(t1)):
+        return None
+    table = get_table(tide, directory)
+    if table is not None and table.covers(t0, t1):
+        return table
+    return None
+
+def build(tide, first_year, last_year, directory = None):
+    """Computes and saves the extrema of tide for whole years (UTC).
+
+    An existing table of the model is extended rather than replaced.
+    Returns the table.
+    """
+    start = datetime.datetime(first_year, 1, 1, tzinfo = datetime.timezone.utc)
+    end = datetime.datetime(last_year + 1, 1, 1, tzinfo = datetime.timezone.utc)
+    existing = get_table(tide, directory)
+    if existing is not None:
+        start = min(start, _EPOCH_UTC + datetime.timedelta(
+            microseconds = int(existing.span[0])))
+        end = max(end, _EPOCH_UTC + datetime.timedelta(
+            microseconds = int(existing.span[1])))
+    table = ExtremaTable.compute(tide, start, end)
+    table.save(table_path(model_hash(tide), directory))
+    return table
@@ -1,26 +1,307 @@
 """
 FTP helper functions
 """
+import atexit
+import hashlib
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from ftplib import FTP
+from ftplib import FTP, Error, all_errors, error_perm, error_reply
+from tidepredict import constants
+
+#Errors of an FTP session or its connection.  Other errors, such as a full
+#disk while a download is written, are not a reason to retry on a new
+#session.
+NETWORK_ERRORS = (Error, EOFError, ConnectionError, socket.timeout,
+                  socket.gaierror, socket.herror)
+
+#When offline, files are only served from the download cache.  Also set by
+#the TIDEPREDICT_OFFLINE environment variable.
+offline = os.environ.get("TIDEPREDICT_OFFLINE", "") not in ("", "0")
+
+class OfflineError(EnvironmentError):
+    """Raised when a file is requested offline which is not cached"""
+
+class DownloadCache:
+    """A persistent cache of files downloaded by FTP.
+
+    Files are stored by the sha256 of their content under objects/, with an
+    index keyed by server and path recording the MDTM and SIZE reported by
+    the server when each was downloaded.  When the cache exceeds maxsize
+    bytes the least recently used files are evicted.
+    """
+
+    def __init__(self, directory, maxsize = constants.FTPCACHE_SIZE):
+        self.directory = directory
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+
+    @property
+    def indexfile(self):
+        return self.directory / "index.json"
+
+    def _read_index(self):
+        try:
+            return json.loads(self.indexfile.read_text())
+        except (EnvironmentError, ValueError):
+            return {}
+
+    def _write_index(self, index):
+        #write then rename so that readers never see a partial index
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as fh:
+            json.dump(index, fh)
+        os.replace(tmp, self.indexfile)
+
+    def object_path(self, digest):
+        return self.directory / "objects" / digest[:2] / digest
+
+    def lookup(self, key):
+        """Returns the index entry for key if its file is cached, else None
+        """
+        with self._lock:
+            entry = self._read_index().get(key)
+        if entry is None or not self.object_path(entry["sha256"]).exists():
+            return None
+        return entry
+
+    def touch(self, key):
+        """Marks key as recently used and returns the path of its file, or
+        None if it has been evicted since it was looked up
+        """
+        with self._lock:
+            index = self._read_index()
+            entry = index.get(key)
+            if entry is None:
+                return None
+            entry["atime"] = time.time()
+            self._write_index(index)
+            path = self.object_path(entry["sha256"])
+        return path if path.exists() else None
+
+    def store(self, key, tmpfile, digest, mdtm, size):
+        """Moves a downloaded file into the cache and returns its path"""
+        path = self.object_path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmpfile, path)
+        with self._lock:
+            index = self._read_index()
+            index[key] = {"sha256": digest, "mdtm": mdtm, "size": size,
+                          "atime": time.time()}
+            self._evict(index, keep=key)
+            self._write_index(index)
+        return path
+
+    def _evict(self, index, keep):
+        total = sum(entry["size"] or 0 for entry in index.values())
+        for key in sorted(index, key=lambda k: index[k]["atime"]):
+            if total <= self.maxsize:
+                break
+            if key == keep:
+                continue
+            entry = index.pop(key)
+            total -= entry["size"] or 0
+            #the same content may still be referenced by another key
+            if all(e["sha256"] != entry["sha256"] for e in index.values()):
+                try:
+                    self.object_path(entry["sha256"]).unlink()
+                except EnvironmentError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+cache = DownloadCache(constants.FTPCACHE)
+
+class FTPPool:
+    """A thread-safe pool of logged in FTP sessions, so that successive
+    requests to a server reuse a session rather than connecting and logging
+    in again.
+
+    A session idle for more than maxidle seconds is checked with NOOP before
+    being reused, and a request which fails on a reused session (such as one
+    closed by the server's idle timeout) is retried once on a new session.
+    At most maxsize idle sessions are kept for each server.
+    """
+
+    def __init__(self, maxidle = 30.0, maxsize = 4):
+        self.maxidle = maxidle
+        self.maxsize = maxsize
+        self.connections = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, ftpurl):
+        """Returns a session for ftpurl and whether it was reused"""
+        while True:
+            with self._lock:
+                idle = self._idle.get(ftpurl)
+                if not idle:
+                    break
+                ftp, last_used = idle.pop()
+            if time.time() - last_used < self.maxidle:
+                return ftp, True
+            try:
+                ftp.voidcmd("NOOP")
+                return ftp, True
+            except all_errors:
+                ftp.close()
+        with self._lock:
+            self.connections += 1
+        return connect(ftpurl), False
+
+    def _release(self, ftpurl, ftp):
+        with self._lock:
+            idle = self._idle.setdefault(ftpurl, [])
+            if len(idle) < self.maxsize:
+                idle.append((ftp, time.time()))
+                return
+        _quit(ftp)
+
+    def call(self, ftpurl, function):
+        """Returns function(ftp) called with a pooled session to ftpurl"""
+        ftp, reused = self._acquire(ftpurl)
+        while True:
+            try:
+                result = function(ftp)
+            except (error_perm, error_reply):
+                #the request was refused but the session is fine
+                self._release(ftpurl, ftp)
+                raise
+            except NETWORK_ERRORS:
+                ftp.close()
+                if not reused:
+                    raise
+                ftp, reused = connect(ftpurl), False
+                with self._lock:
+                    self.connections += 1
+                continue
+            except BaseException:
+                #a local error, the session may be part way through a
+                #transfer so it is not reused
+                ftp.close()
+                raise
+            self._release(ftpurl, ftp)
+            return result
+
+    def close(self):
+        """Closes all idle sessions"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for sessions in idle.values():
+            for ftp, _ in sessions:
+                _quit(ftp)
+
+pool = FTPPool()
+atexit.register(pool.close)
+
+def _quit(ftp):
+    try:
+        ftp.quit()
+    except all_errors:
+        ftp.close()
+
+def connect(ftpurl):
+    """Returns an anonymous FTP session to ftpurl, a host name optionally
+    followed by :port
+    """
+    host, _, port = ftpurl.partition(":")
+    ftp = FTP()
+    ftp.connect(host, int(port or 21))
+    ftp.login() # Username: anonymous password: anonymous@
+    return ftp
+
+def _modified(ftp, ftpfile):
+    """Returns the MDTM and SIZE of a file on the server, or None for
+    either if the server does not support it.
+    """
+    try:
+        mdtm = ftp.sendcmd("MDTM /%s" % ftpfile).split()[-1]
+    except (error_perm, error_reply):
+        mdtm = None
+    try:
+        ftp.voidcmd("TYPE I")
+        size = ftp.size("/%s" % ftpfile)
+    except (error_perm, error_reply):
+        size = None
+    return mdtm, size
+
+def get_file(ftpurl, ftpfile):
+    """Returns the path of a local copy of a file on an FTP site.
+
+    The file is downloaded to the download cache, unless the cached copy
+    is still current according to the server's MDTM and SIZE.
+    """
+    assert ftpfile != "", "FTP string must not be empty"
+    key = "%s/%s" % (ftpurl, ftpfile.lstrip("/"))
+    if offline:
+        path = cache.touch(key)
+        if path is None:
+            raise OfflineError("%s is not in the download cache" % key)
+        return path
+    entry = cache.lookup(key)
+
+    def fetch(ftp):
+        mdtm, size = _modified(ftp, ftpfile)
+        if (entry is not None and mdtm is not None
+                and (entry["mdtm"], entry["size"]) == (mdtm, size)):
+            path = cache.touch(key)
+            #otherwise evicted by another download, so fetched again
+            if path is not None:
+                return path
+
+        cache.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache.directory, suffix=".part")
+        digest = hashlib.sha256()
+        with os.fdopen(fd, "wb") as fh:
+            def handle_binary(more_data):
+                fh.write(more_data)
+                digest.update(more_data)
+            ftpstring = "RETR /%s"%(ftpfile)
+            print("ftp request:%s"%ftpstring)
+            try:
+                ftp.retrbinary(ftpstring, callback=handle_binary)
+            except BaseException:
+                fh.close()
+                os.unlink(tmp)
+                raise
+        return cache.store(key, tmp, digest.hexdigest(), mdtm,
+                           os.path.getsize(tmp) if size is None else size)
+
+    return pool.call(ftpurl, fetch)
+
+def fetch_many(requests, max_workers = constants.FTP_WORKERS):
+    """Returns the paths of local copies of (ftpurl, ftpfile) pairs, in the
+    order requested.  Up to max_workers files are fetched concurrently,
+    each over its own pooled session.
+    """
+    requests = list(requests)
+    if max_workers <= 1 or len(requests) <= 1:
+        return [get_file(*request) for request in requests]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(requests))) as ex:
+        return list(ex.map(lambda request: get_file(*request), requests))
+
+def get_files(ftpurl, ftpfiles, max_workers = constants.FTP_WORKERS):
+    """Returns the paths of local copies of several files on an FTP site"""
+    return fetch_many([(ftpurl, ftpfile) for ftpfile in ftpfiles],
+                      max_workers)
 
 def get_byte_stream(ftpurl, ftpfile):
     """Returns a file byte stream retrieved from an FTP site"
     Input: 
         ftpfile is a string representing an internet ftp location
     """
+    return BytesIO(get_file(ftpurl, ftpfile).read_bytes())
 
-    #check for null string
-    assert ftpfile != "", "FTP string must not be empty"
-    #print(ftpurl)
-    ftp = FTP(ftpurl)
-    ftp.login() # Username: anonymous password: anonymous@
-    sio = BytesIO()
-    def handle_binary(more_data):
-        sio.write(more_data)
-    ftpstring = "RETR /%s"%(ftpfile)
-    
-    print("ftp request:%s"%ftpstring)
-    resp = ftp.retrbinary(ftpstring, callback=handle_binary)
-    sio.seek(0) # Go back to the start
-    return sio
\ No newline at end of file
+def get_byte_streams(ftpurl, ftpfiles, max_workers = constants.FTP_WORKERS):
+    """Returns file byte streams for several files on an FTP site"""
+    return [BytesIO(path.read_bytes())
+            for path in get_files(ftpurl, ftpfiles, max_workers)]
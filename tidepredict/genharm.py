@@ -0,0 +1,212 @@
+"""
+Generation of harmonic constants from University of Hawaii research quality
+data, for one station or in bulk.
+
+In bulk the data archives and QA files are downloaded by a pool of threads
+in the main process, which owns the download cache, and parsed and fitted
+by a pool of processes, one per core. Each station is written to the harmonics store as soon as it
+has been fitted, so an interrupted run resumes with the stations which are
+not yet in the store.
+"""
+import contextlib
+import io
+import multiprocessing
+import sys
+import time
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+
+from tidepredict import (constants, ftp_helpers, processdata,
+                         process_station_info, stationindex, timefunc)
+
+def station_code(thestation):
+    """Returns the code of a station record of the station index"""
+    return "h" + thestation['stat_idx'].lower()
+
+def fetch(thestation):
+    """Downloads the hourly data archive and the QA file of a station and
+    returns their local paths
+    """
+    loc_code = station_code(thestation)
+    ocean = constants.ocean_dict[thestation['oc_idx'][0]]
+    ftpurl = processdata.get_data_url(ocean = ocean)
+    zippath, qapath = ftp_helpers.get_files(constants.FTP_BASE,
+                    [processdata.get_data_file(ftpurl, loc_code),
+                     process_station_info.get_qa_file(loc_code, ocean)])
+    return zippath, qapath
+
+def fit(thestation, zippath, qapath, version):
+    """Fits the harmonic model of a station to its downloaded data.
+
+    Returns the station code, the station information for the harmonics
+    store and the fitted Tide.
+    """
+    loc_code = station_code(thestation)
+    ocean = constants.ocean_dict[thestation['oc_idx'][0]]
+    ftpurl = processdata.get_data_url(ocean = ocean)
+    #get the last two years that data exists for
+    lastyear = int(thestation['data_years'][-2:])
+    years = list(range(lastyear-1,lastyear+1))
+    data = processdata.process_unhw_data(ftpurl = ftpurl,
+                                         years = years,
+                                         loc_code = loc_code,
+                                         sio = zippath)
+    my_tides = processdata.fit_model(data)
+
+    #get QA doc, returns a dict of dicts
+    station_dict = {}
+    with open(qapath, "rb") as qafile:
+        process_station_info.get_station_info(loc_code, ocean, station_dict,
+                                              qafile = qafile)
+    station = station_dict[loc_code]
+    #set location data version for compatibility
+    station['version'] = version
+    lat, lon = process_station_info.deg_2_decimal(thestation['Lat'],
+                                                  thestation['Lon'])
+    station['lat'] = lat
+    station['lon'] = lon
+    #the timezone is resolved when the station list is built, only
+    #station lists from older versions need a lookup here
+    station['tzone'] = (thestation.get('tzone') or
+                        timefunc.station_timezone(lat, lon))
+    station['name'] = thestation['loc_name']
+    station['country'] = thestation['country']
+    station['contributor'] = thestation['Contributor']
+    return loc_code, station, my_tides
+
+def generate(thestation, version):
+    """Downloads the data of a station and fits its harmonic model"""
+    zippath, qapath = fetch(thestation)
+    return fit(thestation, zippath, qapath, version)
+
+def select_stations(stations, region = None, countries = None, codes = None):
+    """Returns the stations of the station index which match all of the
+    given filters.
+
+    region: pacific, indian or atlantic (or all)
+    countries: list of country names
+    codes: list of station codes, with or without the h prefix
+    """
+    selected = list(stations)
+    if region is not None and region.lower() != "all":
+        oceans = {v: k for k, v in constants.ocean_dict.items()}
+        try:
+            prefix = oceans[region.lower()]
+        except KeyError:
+            raise ValueError("Region must be one of: %s, or all"
+                             % ", ".join(sorted(oceans)))
+        selected = [s for s in selected if s['oc_idx'][:1] == prefix]
+    if countries:
+        wanted = {stationindex.normalize(country) for country in countries}
+        selected = [s for s in selected
+                    if stationindex.normalize(s['country']) in wanted]
+    if codes:
+        wanted = {code.lower() for code in codes}
+        selected = [s for s in selected
+                    if s['stat_idx'].lower() in wanted
+                    or station_code(s) in wanted]
+    return selected
+
+def _fit_worker(thestation, zippath, qapath, version):
+    """Runs fit in a worker process.
+
+    Returns (station code, station information including the model, error
+    message or None). Output is captured, and errors including sys.exit are
+    returned rather than raised, so one bad station doesn't stop the run.
+    """
+    loc_code = station_code(thestation)
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            loc_code, station, my_tides = fit(thestation, zippath, qapath,
+                                              version)
+    except (Exception, SystemExit) as err:
+        message = str(err) or type(err).__name__
+        lines = output.getvalue().strip().splitlines()
+        if lines:
+            message = "%s (%s)" % (lines[-1], message)
+        return loc_code, None, message
+    station['cons'] = [c.name for c in my_tides.model['constituent']]
+    station['amps'] = my_tides.model['amplitude'].tolist()
+    station['phase'] = my_tides.model['phase'].tolist()
+    return loc_code, station, None
+
+def run(stations, store, version, processes = None, resume = True,
+        max_workers = constants.FTP_WORKERS, out = sys.stdout):
+    """Generates harmonic constants for many stations.
+
+    stations: station records of the station index
+    store: harmstore.HarmonicStore the results are written to
+    version: tidepredict version recorded with each station
+    processes: number of fitting processes (default: number of cores)
+    resume: whether to skip stations which are already in the store
+    max_workers: number of concurrent downloads
+    out: stream progress is reported to
+
+    Returns a dictionary of the error messages of stations which failed.
+    """
+    todo = [s for s in stations
+            if not (resume and station_code(s) in store)]
+    skipped = len(stations) - len(todo)
+    if skipped:
+        print("Skipping %i stations already in the harmonics store"
+              % skipped, file = out)
+    total = len(todo)
+    failed = {}
+    done = 0
+    begin = time.time()
+
+    def report(thestation, started, error = None):
+        print("[%*i/%i] %-6s %-24s %6.1fs %s"
+              % (len(str(total)), done, total, station_code(thestation),
+                 thestation['loc_name'][:24], time.time() - started,
+                 "failed: %s" % error if error else "ok"), file = out)
+        out.flush()
+
+    #spawned rather than forked workers, as the parent process is running
+    #download threads
+    downloads = ThreadPoolExecutor(max_workers = max_workers)
+    fits = ProcessPoolExecutor(max_workers = processes,
+                               mp_context = multiprocessing.get_context("spawn"))
+    #the stage ("download" or "fit"), station and start time of each job
+    jobs = {}
+    try:
+        for thestation in todo:
+            jobs[downloads.submit(fetch, thestation)] = ("download",
+                                                         thestation,
+                                                         time.time())
+        pending = set(jobs)
+        while pending:
+            finished, pending = wait(pending, return_when = FIRST_COMPLETED)
+            for future in finished:
+                stage, thestation, started = jobs.pop(future)
+                try:
+                    result = future.result()
+                except Exception as err:
+                    result = station_code(thestation), None, str(err)
+                else:
+                    if stage == "download":
+                        #downloaded, now fit it
+                        zippath, qapath = result
+                        job = fits.submit(_fit_worker, thestation,
+                                          str(zippath), str(qapath), version)
+                        jobs[job] = ("fit", thestation, started)
+                        pending.add(job)
+                        continue
+                loc_code, station, error = result
+                done += 1
+                if error is None:
+                    #stored straight away, so an interrupted run resumes
+                    store.put(loc_code, station)
+                else:
+                    failed[loc_code] = error
+                report(thestation, started, error)
+    finally:
+        for future in jobs:
+            future.cancel()
+        downloads.shutdown()
+        fits.shutdown()
+
+    print("Generated harmonics for %i of %i stations in %.1fs"
+          % (total - len(failed), total, time.time() - begin), file = out)
+    return failed
@@ -0,0 +1,151 @@
+"""
+SQLite store of the harmonic constants fitted for each station.
+
+Each station is a single row keyed by its station code, so predicting for
+one station reads only that row however many stations have been fitted.
+Constituents are stored as indices into CONSTITUENTS, and amplitudes and
+phases (in degrees) as little endian float64 blobs. The remaining station
+information is kept as JSON.
+"""
+import json
+import sqlite3
+
+import numpy as np
+
+from tidepredict import constants
+from tidepredict import constituent
+from tidepredict.tide import Tide
+
+#Version of the schema below, stored in the database's user_version
+SCHEMA_VERSION = 1
+#Constituents which may appear in a stored model. Only append to this list,
+#the stored indices depend on its order.
+CONSTITUENTS = [constituent._Z0] + constituent.noaa
+INDEX = {c.name: i for i, c in enumerate(CONSTITUENTS)}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stations (
+    code TEXT PRIMARY KEY,
+    info TEXT NOT NULL,
+    constituents BLOB NOT NULL,
+    amplitudes BLOB NOT NULL,
+    phases BLOB NOT NULL
+)
+"""
+
+class SchemaError(Exception):
+    """The store was written by an incompatible version of tidepredict"""
+
+class HarmonicStore:
+    """Harmonic constants and information of fitted stations.
+
+    path: location of the SQLite database, default constants.HARMSTORE
+    legacy: stations_harms.json file to import when the database is
+    created, default constants.HARMFILE, or False to import nothing
+    """
+
+    def __init__(self, path = None, legacy = None):
+        if path is None:
+            path = constants.HARMSTORE
+        if legacy is None:
+            legacy = constants.HARMFILE
+        self.path = path
+        path.parent.mkdir(parents = True, exist_ok = True)
+        self._connection = sqlite3.connect(str(path))
+        version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            self._connection.close()
+            raise SchemaError("%s has schema version %i, newer than %i"
+                              % (path, version, SCHEMA_VERSION))
+        if version < SCHEMA_VERSION:
+            self._create(legacy)
+
+    def _create(self, legacy):
+        """Creates the schema and imports the legacy json file, if any"""
+        with self._connection:
+            self._connection.execute(SCHEMA)
+            if legacy and legacy.exists():
+                stations = json.loads(legacy.read_text() or "{}")
+                for code, station in stations.items():
+                    if "cons" in station:
+                        self._put(code, station)
+            self._connection.execute("PRAGMA user_version = %i"
+                                     % SCHEMA_VERSION)
+
+    def put(self, code, station, tide = None):
+        """Adds or replaces a station in a single transaction.
+
+        station is a dictionary of station information. The harmonic
+        constants are taken from tide if given, otherwise from the 'cons',
+        'amps' and 'phase' entries of station as in stations_harms.json.
+        """
+        if tide is not None:
+            station = dict(station)
+            station['cons'] = [c.name for c in tide.model['constituent']]
+            station['amps'] = tide.model['amplitude'].tolist()
+            station['phase'] = tide.model['phase'].tolist()
+        with self._connection:
+            self._put(code, station)
+
+    def _put(self, code, station):
+        info = {key: value for key, value in station.items()
+                if key not in ('cons', 'amps', 'phase')}
+        try:
+            indices = [INDEX[name] for name in station['cons']]
+        except KeyError as err:
+            raise ValueError("Unknown constituent %s" % err)
+        amplitudes = np.asarray(station['amps'], dtype = '<f8')
+        phases = np.asarray(station['phase'], dtype = '<f8')
+        if not len(indices) == len(amplitudes) == len(phases):
+            raise ValueError("model arrays must be equal length")
+        self._connection.execute(
+            "INSERT OR REPLACE INTO stations VALUES (?, ?, ?, ?, ?)",
+            (code, json.dumps(info),
+             np.asarray(indices, dtype = '<u2').tobytes(),
+             amplitudes.tobytes(), phases.tobytes()))
+
+    def load(self, code):
+        """Returns (station information, Tide) for a station code, or None
+        if the station has not been fitted.
+        """
+        row = self._connection.execute(
+            "SELECT info, constituents, amplitudes, phases FROM stations "
+            "WHERE code = ?", (code,)).fetchone()
+        if row is None:
+            return None
+        info, indices, amplitudes, phases = row
+        indices = np.frombuffer(indices, dtype = '<u2')
+        model = np.zeros(len(indices), dtype = Tide.dtype)
+        model['constituent'] = [CONSTITUENTS[i] for i in indices]
+        model['amplitude'] = np.frombuffer(amplitudes, dtype = '<f8')
+        model['phase'] = np.frombuffer(phases, dtype = '<f8')
+        return json.loads(info), Tide(model = model, radians = False)
+
+    def delete(self, code):
+        with self._connection:
+            self._connection.execute("DELETE FROM stations WHERE code = ?",
+                                     (code,))
+
+    def codes(self):
+        """Returns the codes of all stored stations"""
+        return [row[0] for row in
+                self._connection.execute("SELECT code FROM stations "
+                                         "ORDER BY code")]
+
+    def __contains__(self, code):
+        return self._connection.execute(
+            "SELECT 1 FROM stations WHERE code = ?", (code,)).fetchone() \
+            is not None
+
+    def __len__(self):
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM stations").fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,19 +1,151 @@
-#generate PNG graph of tides
+"""
+Tide graphs as PNG files.
 
+Graphs are drawn straight from NumPy arrays of UTC times and heights with
+matplotlib's Agg backend. A Graph holds one figure and its axes and is
+reused for any number of stations or periods, and render_many renders a
+batch of graphs in one process or shared between a pool of processes.
+"""
 import datetime
-from tidepredict.tide import Tide
-from tidepredict import constants
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-#import matplotlib.pyplot as plt
-import pandas as pd
 import matplotlib as mpl
-import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-import pytz
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from tidepredict import constants, timefunc
 
 mpl.rcParams['font.size'] = 8
 
+#time between the heights of a graph
+STEP = np.timedelta64(6, "m")
+
+def sample(tide, timeobj, days = constants.GRAPHSPAN):
+    """Predicts the tide for days from the start time of timeobj.
+
+    Returns UTC datetime64 times every STEP and their heights, and the UTC
+    datetime64 times and heights of the high and low tides.
+    """
+    start = timeobj.st_utc
+    end = start + datetime.timedelta(days = days)
+    first = np.datetime64(start.replace(tzinfo = None), "us")
+    times = np.arange(first, first + np.timedelta64(end - start) + STEP, STEP)
+    heights = tide.at(times)
+    extrema = list(tide.extrema(start, end))
+    extrema_times = timefunc.utc_datetime64([e[0] for e in extrema])
+    extrema_heights = np.array([e[1] for e in extrema], dtype = float)
+    return times, heights, extrema_times, extrema_heights
+
+def write_csv(times, heights, extrema_times, extrema_heights,
+              csvfile = constants.CSVFILE, extrmfile = constants.EXTRMFILE):
+    """Writes heights and extrema as csv files of milliseconds since
+    1970-01-01 UTC and heights in metres
+    """
+    for path, stamps, values, label in (
+            (csvfile, times, heights, "tide height in (m)"),
+            (extrmfile, extrema_times, extrema_heights, "height")):
+        millis = stamps.astype("datetime64[ms]").astype(np.int64)
+        np.savetxt(path, np.column_stack([millis, values]),
+                   fmt = ["%d", "%.3f"], delimiter = ",",
+                   header = "DateTime," + label, comments = "")
+
+class Graph:
+    """A figure which tide graphs are drawn on and saved from.
+
+    The axes, line and ticks are kept between graphs and only their data
+    is replaced, which is much quicker than drawing new axes each time.
+    """
+
+    def __init__(self, figsize = (12, 4)):
+        self.figure = Figure(figsize = figsize)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        self.ax.grid(axis = 'y')
+        self.ax.set_ylabel("tide height in metres")
+        self.line, = self.ax.plot([], [])
+        #artists replaced for each graph
+        self.drawn = []
+
+    def draw(self, station_data, timeobj, times, heights, extrema_times,
+             extrema_heights):
+        """Draws heights at UTC datetime64 times, with hours and the high
+        and low tides labelled in the timezone of timeobj
+        """
+        ax = self.ax
+        for artist in self.drawn:
+            artist.remove()
+        x = mdates.date2num(times)
+        self.line.set_data(x, heights)
+        ax.relim()
+        ax.autoscale_view(scalex = False)
+        ax.set_xlim(x[0], x[-1])
+        ax.set_title(station_data['name'] + ", " + station_data['country']
+                     + " Timezone: " + station_data['tzone'])
+        ax.xaxis.set_major_locator(mdates.HourLocator(interval = 1,
+                                                      tz = timeobj.tz))
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%H',
+                                                          tz = timeobj.tz))
+        self.drawn = [ax.fill_between(x, heights, heights.min(), color = 'b',
+                                      alpha = 0.5)]
+
+        #label the high and low tides with their local dates and times,
+        #offset lower so they are always in the graph limits
+        maxval = heights.max() - 0.1
+        local = timeobj.localise_array(extrema_times)
+        for x, stamp in zip(mdates.date2num(extrema_times),
+                            np.datetime_as_string(local, unit = "m")):
+            self.drawn.append(ax.text(x, maxval,
+                                      stamp[:10] + "\n" + stamp[11:]))
+
+    def render(self, tide, station_data, timeobj, path = constants.GRAPHFILE,
+               days = constants.GRAPHSPAN):
+        """Saves the graph of a station for days from the start time of
+        timeobj as a PNG file and returns the data drawn (see sample)
+        """
+        data = sample(tide, timeobj, days)
+        self.draw(station_data, timeobj, *data)
+        self.figure.savefig(path, format = "png")
+        return data
+
+def _render_jobs(jobs, days):
+    """Renders a list of jobs on one Graph, in a worker process"""
+    graph = Graph()
+    for tide, station_data, timeobj, path in jobs:
+        graph.render(tide, station_data, timeobj, path, days)
+    return [str(job[3]) for job in jobs]
+
+def render_many(jobs, processes = 1, days = constants.GRAPHSPAN):
+    """Renders a graph for each (tide, station information, Tidetime, path)
+    of jobs.
+
+    processes: number of processes the jobs are shared between, None for
+    one per core. With one process the graphs are rendered in this process.
+
+    Returns the paths written.
+    """
+    jobs = list(jobs)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(jobs)))
+    if processes == 1:
+        return _render_jobs(jobs, days)
+    size = math.ceil(len(jobs) / processes)
+    chunks = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+    with ProcessPoolExecutor(max_workers = len(chunks),
+            mp_context = multiprocessing.get_context("spawn")) as pool:
+        return [path for paths in pool.map(_render_jobs, chunks,
+                                           [days] * len(chunks))
+                for path in paths]
+
 class Plotpng():
+    """Saves the graph, heights and extrema of a station as GRAPHFILE,
+    CSVFILE and EXTRMFILE
+    """
 
     def __init__(self,
                 tide,
@@ -28,71 +160,6 @@ class Plotpng():
         self.get_tides()
 
     def get_tides(self):
-        # Prepare a list of datetimes, each 6 minutes apart between start and
-        # end time.
-        timesutc = pd.date_range(self.timeobj.st_utc, 
-                                 self.timeobj.st_utc + 
-                                 datetime.timedelta(days=constants.GRAPHSPAN),
-                                 freq='6min',
-                                 tz="UTC")
-
-        #print(timesutc[:5])
-        mpl.rcParams['timezone'] = str(self.timeobj.tz)
-
-        timeslocal = self.timeobj.localiselist(timesutc)
-        #print(timeslocal[:5])
-        #print(timeslocal)
-        #Generate tide heights
-        my_prediction = self.tide.at(timesutc.tolist())
-        #print(my_prediction)
-        df = pd.DataFrame(index=timeslocal, data = my_prediction,
-                         columns = ["tide height in (m)"] )
-        #print(df.head())
-
-        fig, ax = plt.subplots(figsize=[12,4])
-        df.plot(ax=ax, legend=None)
-        plt.grid(axis='y')
-        #plt.tick_params(axis="y",direction="in",pad=-25)
-        #plt.tick_params(axis="x",direction="in",pad=-15,)
-        
-        plt.title(self.station_data['name'] + ", " 
-                 + self.station_data['country'] + " Timezone: " +
-                 self.station_data['tzone'])
-        plt.ylabel("tide height in metres")
-        hours = mdates.HourLocator(interval = 1)
-        h_fmt = mdates.DateFormatter('%H')
-        ax.xaxis.set_major_locator(hours)
-        ax.xaxis.set_major_formatter(h_fmt)
-        plt.fill_between(df.index,df['tide height in (m)'],
-                        df['tide height in (m)'].min(), color='b', alpha=0.5)
-
-        #plot extrema dates as text
-        extremaUTC = self.tide.extrema(self.timeobj.st_utc, 
-                     self.timeobj.st_utc +
-                     datetime.timedelta(days=constants.GRAPHSPAN))
-        #get max extent for plotting position
-        #offset lower so it is always in the graph limits
-        maxval = df['tide height in (m)'].max() -0.1 
-        fmt = "%Y-%m-%d\n%H:%M"
-        extrema = []
-        for e in extremaUTC:
-        #print(e)
-        #get localised time
-            time = self.timeobj.localise(e[0])
-
-            plt.text(time, maxval, time.strftime(fmt))
-            extrema.append({"time":e[0], "height":e[1]})
-        #plt.margins(y=0.1)
-        #plt.show()
-        plt.savefig(constants.GRAPHFILE, format="png")
-        #convert datetime to timestamp using method from stackoverflow
-        #answer in ms.
-        df.index = df.index.values.astype(np.int64) // 10 ** 6
-        df.to_csv(constants.CSVFILE, float_format='%.3f', index_label='DateTime')
-        print(df.head())
-        extrema_df = pd.DataFrame(extrema)
-        extrema_df.index = extrema_df['time'].values.astype(np.int64) // 10 ** 6
-        extrema_df.drop(columns=['time'], inplace=True)
-        extrema_df.to_csv(constants.EXTRMFILE, float_format='%.3f', index_label='DateTime')
-        print(extrema_df)
-
+        data = Graph().render(self.tide, self.station_data, self.timeobj)
+        write_csv(*data)
+        print("Saved tide graph to %s" %constants.GRAPHFILE)
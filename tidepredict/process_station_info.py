@@ -1,13 +1,19 @@
 from tidepredict import constants, ftp_helpers
 import re
 
-def get_station_info(loc_code, ocean, station_dict):
+def get_qa_file(loc_code, ocean):
+    """returns the path on the uhslc server of the QA file for a station
+    """
+    return constants.qa_ftp(ocean) + "qa%s.dmt" %loc_code[1:]
+
+def get_station_info(loc_code, ocean, station_dict, qafile = None):
     """returns info gathered about the station from the QA file
+
+    qafile is an optional byte stream of the already downloaded QA file
     """
-    
-    qafile = ftp_helpers.get_byte_stream(constants.FTP_BASE,
-                                        "uhslc/rqds/%s/doc/qa%s.dmt" %(ocean,
-                                                    loc_code[1:]))
+    if qafile is None:
+        qafile = ftp_helpers.get_byte_stream(constants.FTP_BASE,
+                                             get_qa_file(loc_code, ocean))
     text = qafile.read().decode()
     try:
         meridian = re.search(r"Meridian: (\w*)", text).group(1)
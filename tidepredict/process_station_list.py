@@ -6,17 +6,19 @@ from tidepredict import ftp_helpers
 import pandas as pd
 from io import StringIO
 from tidepredict import constants
-import json
+from tidepredict import stationindex
+from tidepredict import timefunc
+from tidepredict.process_station_info import deg_2_decimal
 import pathlib
 import os
 
 def get_station_files():
     """Get bytes IO objects from each of the station list files
     """
-    ftpurl = "ftp.soest.hawaii.edu"
-    pacific = ftp_helpers.get_byte_stream(ftpurl,"uhslc/rqds/pacific/pacific.lst")
-    indian = ftp_helpers.get_byte_stream(ftpurl,"uhslc/rqds/indian/indian.lst")
-    atlantic = ftp_helpers.get_byte_stream(ftpurl,"uhslc/rqds/atlantic/atlantic.lst")
+    pacific, indian, atlantic = ftp_helpers.get_byte_streams(constants.FTP_BASE,
+                                    ["uhslc/rqds/pacific/pacific.lst",
+                                     "uhslc/rqds/indian/indian.lst",
+                                     "uhslc/rqds/atlantic/atlantic.lst"])
 
     return pacific, indian, atlantic
 
@@ -43,41 +45,24 @@ def create_station_dataframe():
                                    "country", "Lat", "Lon", "data_years",
                                    "CI", "Contributor"])
 
+    #resolve the timezone of every station once, here, rather than each
+    #time harmonics are generated for it
+    stat_df["tzone"] = [get_station_timezone(lat, lon)
+                        for lat, lon in zip(stat_df.Lat, stat_df.Lon)]
+
     #dump to file
     os.makedirs(os.path.dirname(constants.STATIONFILE), exist_ok=True)
     
     stat_df.to_csv(constants.STATIONFILE)
+    stationindex.StationIndex(stat_df.to_dict("records")).save()
     return stat_df
     
-def read_station_info_file():
-    """Reads the station info json file which contains downloaded and 
-    processed harmonics model data for each station that has had
-    -harmgen run
+def get_station_timezone(latitude, longitude):
+    """Returns the timezone of a station from its station list position, or
+    an empty string if the position can't be read
     """
-    if not constants.SAVEHARMLOCATION.exists():
-        constants.SAVEHARMLOCATION.mkdir(parents=True)
-
-    harmfileloc = constants.SAVEHARMLOCATION / "stations_harms.json"
-    if not harmfileloc.exists():
-        #create the file
-        harmfileloc.touch()
-        adict = {}
-        harmfileloc.write_text(json.dumps(adict))
-    #load station harmonics data
-    return json.loads(harmfileloc.read_text()), harmfileloc
-
-def write_station_info_file(harmfileloc, stationdict):
-    harmfileloc.write_text(json.dumps(stationdict))
-
-
-
-
-    
-
-
-
-
-    
-
-    
-
+    try:
+        lat, lon = deg_2_decimal(latitude, longitude)
+    except (AssertionError, TypeError, ValueError):
+        return ""
+    return timefunc.station_timezone(lat, lon) or ""
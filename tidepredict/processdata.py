@@ -11,24 +11,22 @@ Datasets and background info available from:
 ftp://ftp.soest.hawaii.edu/uhslc/rqds/
 """
 from __future__ import print_function
+import csv
 import datetime
+import io
+import itertools
 from tidepredict.tide import Tide
 import numpy as np
 #import matplotlib.pyplot as plt
-import pandas as pd
-import io
 import zipfile
 import sys
-from ftplib import FTP
 import calendar
-import pytz
-from jinja2 import Environment, FileSystemLoader
 from tidepredict import ftp_helpers
 from tidepredict import constants
-import json
-from tidepredict import constituent
-import dateutil
+from tidepredict import harmstore
+from tidepredict import timefunc
 import pathlib
+import re
 
 def get_data_url(ocean = "pacific"):
     """returns the data file url for the uhslc server for a specific
@@ -51,63 +49,75 @@ def get_data_url(ocean = "pacific"):
         sys.exit(1)
     return ftpurl  
 
-def predict_plain(tide, station_dict, format, timeobj):
+def write_plain(tide, station_dict, format, timeobj, out, chunk = 4096):
     """
-    Generates tide predictions similar to Xtide's plain mode.
-    startdate for prediction (Python datetime)
-    enddate:  enddate for prediction
+    Writes tide predictions similar to Xtide's plain mode to out as they
+    are generated.
     tide: the tide model to use
+    format: t for text, c for csv
+    timeobj: Tidetime of the period to predict
+    out: text file-like object, e.g. sys.stdout or a file
+    chunk: number of extrema localised and written at a time
+    Returns the number of extrema written.
     """
-    
+    name = station_dict['name']
+    tz = str(timeobj.tz)
     if format == "t":
-        extrema = "Tide forecast for %s, %s\n" %(station_dict['name'],
-                                        station_dict['country'])
-        extrema += "Latitude:%5.2f Longitude:%5.2f\n" %(station_dict['lat'],
-                                        station_dict['lon'])                                                                
+        out.write("Tide forecast for %s, %s\n" %(name,
+                                        station_dict['country']))
+        out.write("Latitude:%5.2f Longitude:%5.2f\n" %(station_dict['lat'],
+                                        station_dict['lon']))
     else:
-        extrema = ""
+        writer = csv.writer(out, lineterminator = "\n")
+    kinds = {"L": " Low Tide", "H": " High Tide"}
 
     extremaUTC = tide.extrema(timeobj.st_utc, timeobj.en_utc)
-    #print(extremaUTC)
-    
-    for e in extremaUTC:
-        #print(e)
-        #get localised time
-        time = timeobj.localise(e[0])
-        height = e[1]
-        if format == "c":
-            #csv so append station name
-            extrema += station_dict['name'] + ","
-            extrema += time.strftime("%Y-%m-%d,%H%M")
-        else:
-            extrema += time.strftime("%Y-%m-%d %H%M")
-        
+    count = 0
+    while True:
+        block = list(itertools.islice(extremaUTC, chunk))
+        if not block:
+            break
+        count += len(block)
+        #localise the whole block at once, stamps are YYYY-MM-DDTHH:MM
+        local = timeobj.localise_array(
+            timefunc.utc_datetime64([e[0] for e in block]))
+        stamps = np.datetime_as_string(local, unit = "m").tolist()
         if format == "c":
-            extrema += ",%s," %timeobj.tz
+            #csv so include the station name
+            writer.writerows([name, stamp[:10], stamp[11:13] + stamp[14:],
+                              tz, "%5.2f" %e[1], kinds.get(e[2], " High Tide")]
+                             for stamp, e in zip(stamps, block))
         else:
-            extrema += " %s" %timeobj.tz
-
-        extrema += "%5.2f" %height   
+            out.write("".join("%s %s%s %s%5.2f%s\n"
+                              %(stamp[:10], stamp[11:13], stamp[14:], tz,
+                                e[1], kinds.get(e[2], " High Tide"))
+                              for stamp, e in zip(stamps, block)))
+    return count
 
-        if format == "c":
-            extrema += ","
-        
-        if e[2] == "L":
-            extrema += " Low Tide"
-        else:
-            extrema += " High Tide"
-        extrema += "\n"    
-    
-    return extrema
+def predict_plain(tide, station_dict, format, timeobj):
+    """
+    Generates tide predictions similar to Xtide's plain mode and returns
+    them as a string. See write_plain for long periods.
+    tide: the tide model to use
+    format: t for text, c for csv
+    timeobj: Tidetime of the period to predict
+    """
+    out = io.StringIO()
+    write_plain(tide, station_dict, format, timeobj, out)
+    return out.getvalue()
 
 
 def reconstruct_tide_model(station_dict, loc_code):
     """
-    Method to reconstruct the tide model from the dictionary of all stations
-    input: tm_file, which is the open json file
+    Method to reconstruct the tide model of a station
+    input: station_dict, either a harmstore.HarmonicStore or the dictionary
+    of all stations read from the legacy stations_harms.json
     """
+    if isinstance(station_dict, harmstore.HarmonicStore):
+        record = station_dict.load(loc_code)
+        return None if record is None else record[1]
     try:
-        constits = [constituent.__getattribute__("_"+cstr) 
+        constits = [harmstore.CONSTITUENTS[harmstore.INDEX[cstr]]
                 for cstr in station_dict[loc_code]['cons']]
     except KeyError:
         return None
@@ -122,100 +132,189 @@ def reconstruct_tide_model(station_dict, loc_code):
     tide = Tide(model = model, radians = False)
     return tide
 
-def process_unhw_data(ftpurl, years = [15,16], loc_code = "h551a"):
-    """Processes university of Hawaii data into a Python dictionary.
+def get_data_file(ftpurl, loc_code):
+    """returns the path on the uhslc server of the zip archive of hourly
+    data for a station
+    """
+    return "%s/hourly/%s.zip"%(ftpurl,loc_code)
+
+#UHSLC hourly records are fixed width: the year, month, day and half day
+#(1 or 2) occupy columns 12-20 and are followed by twelve 5 digit hourly
+#values in millimetres, with 9999 (or -9999) marking missing data.
+UNHW_DATE = slice(11, 20)
+UNHW_VALUES = slice(20, 80)
+UNHW_MISSING = 9999
+
+#Lookup tables from ascii codes to digit values and to character classes
+#(0 digit, 1 blank, 2 minus sign, 3 anything else)
+_DIGIT_VALUE = np.zeros(256, dtype = np.int32)
+_DIGIT_VALUE[48:58] = np.arange(10)
+_CHAR_CLASS = np.full(256, 3, dtype = np.int8)
+_CHAR_CLASS[48:58] = 0
+_CHAR_CLASS[[0, 32]] = 1
+_CHAR_CLASS[45] = 2
+
+def _decode_fields(chars, width):
+    """Decodes a (rows, n * width) array of ascii characters holding right
+    aligned integer fields into a (rows, n) array of integers
+    """
+    fields = chars.reshape(len(chars), -1, width)
+    classes = np.take(_CHAR_CLASS, fields)
+    #every field must end in a digit and contain only blanks, a sign and
+    #digits
+    if not ((classes[:, :, -1] == 0).all() and (classes < 3).all()):
+        raise ValueError("Malformed fixed width record")
+    values = np.take(_DIGIT_VALUE, fields[:, :, 0])
+    for k in range(1, width):
+        values = values * 10 + np.take(_DIGIT_VALUE, fields[:, :, k])
+    negative = (classes == 2).any(axis = 2)
+    return np.where(negative, -values, values)
+
+def parse_unhw_dat(raw):
+    """Parses the contents of a University of Hawaii hourly .dat file.
+
+    Inputs:
+    raw: bytes of the file, including its header line
+
+    Outputs:
+    times: datetime64[h] array of the (UTC) hours
+    heights: float array of the heights in metres
+    valid: boolean array, False where the value is missing
+    """
+    #ignore header info on the first row and any blank lines
+    lines = raw.splitlines()[1:]
+    records = np.array(lines, dtype = "S%i" % UNHW_VALUES.stop)
+    records = records[np.char.strip(records) != b""]
+    chars = records.view(np.uint8).reshape(len(records), -1)
+
+    date = _decode_fields(chars[:, UNHW_DATE], 1)
+    year = date[:, :4] @ [1000, 100, 10, 1]
+    month = date[:, 4:6] @ [10, 1]
+    day = date[:, 6:8] @ [10, 1]
+    #the first row of each day holds hours 0-11 and the second 12-23
+    half = np.where(date[:, 8] == 1, 0, 12)
+    days = ((year - 1970) * 12 + month - 1).astype("datetime64[M]") \
+           .astype("datetime64[D]") + (day - 1)
+    times = days.astype("datetime64[h]")[:, None] + half[:, None] \
+            + np.arange(12)
+
+    values = _decode_fields(chars[:, UNHW_VALUES], 5)
+    valid = np.abs(values) != UNHW_MISSING
+    return times.ravel(), values.ravel() / 1000, valid.ravel()
+
+#Members of the hourly zip archives are named [hi]<station><yy>.dat, where
+#the h prefix is used for the 1900s and i for the 2000s.
+UNHW_MEMBER = re.compile(r"(?:.*/)?([hi])([0-9a-z]+?)(\d{2})\.dat$", re.I)
+UNHW_CENTURY = {"h": 1900, "i": 2000}
+
+def unhw_members(names):
+    """Indexes the members of an hourly zip archive by four digit year
+
+    Inputs:
+    names: member names of the archive, e.g. ZipFile.namelist()
+
+    Outputs:
+    Dictionary in the form of {year: member name}
+    """
+    index = {}
+    for name in names:
+        match = UNHW_MEMBER.match(name)
+        if match is None:
+            continue
+        prefix, _, yy = match.groups()
+        index[UNHW_CENTURY[prefix.lower()] + int(yy)] = name
+    return index
+
+def _unhw_year(year, index):
+    """Returns the four digit year in index for a two (or four) digit year"""
+    if year >= 100:
+        return year
+    #assume a two digit year after the current year is pre 2000
+    if year > datetime.datetime.today().year % 100:
+        candidates = (1900 + year, 2000 + year)
+    else:
+        candidates = (2000 + year, 1900 + year)
+    for candidate in candidates:
+        if candidate in index:
+            return candidate
+    return candidates[0]
+
+def process_unhw_data(ftpurl, years = [15,16], loc_code = "h551a", sio = None):
+    """Processes university of Hawaii data into arrays of times and heights.
 
     Inputs:
     years: years of data (default most recent two years) as a list of 
-           year ints
+           two or four digit year ints
     location: unhw code for the location to retrieve. Default: Lyttelton, NZ
+    sio: optional path or seekable byte stream of the already downloaded
+         zip archive. By default the archive is read from the download cache.
 
     Outputs:
-    Dictionary in the form of {DateTime:TideLevel}
-    timestamps are hourly.
+    Tuple of (times, heights) where times is a datetime64[h] array of
+    hourly UTC timestamps and heights is an array of tide levels in metres.
+    Missing values are dropped.
 
     """
-    datalist = []  
-    #print(zipdat)
-    #print(filedata)
-    sio = ftp_helpers.get_byte_stream(constants.FTP_BASE,
-                                      "%s/hourly/%s.zip"%(ftpurl,loc_code))
-    for year in years:
-        #try to open the downloaded zip archive
-        try:
-            zarchive = zipfile.ZipFile(sio)
-        except zipfile.BadZipfile:
-            print("Could not open zip archive")
-            sys.exit()
-
-        #print(zarchive)
-        if year > int(str(datetime.datetime.today().year)[:-2]):
-            #assume pre 2000 so h prefix required.
-            datfile = "h%s%i.dat"%(loc_code[1:],year)
-        else:    
-            datfile = "i%s%i.dat"%(loc_code[1:],year)
-        print("Opening data file:%s"%datfile)
-        try:
-            fdat = zarchive.open(datfile, "r")
-        except RuntimeError:
-            print('RuntimeError')
-            sys.exit()
-
-        #so we have the file data now read it line by line
-        for i, line in enumerate(fdat):
-            #ignore header info on the first row
-            #todo should try and check file validity here.
-            if i == 0:
-              continue
-            #print(line.decode("UTF-8"))
-            linedc = line.decode("UTF-8")
-            #tide height data starts at column 22 (py index = 21)
-            tideheights = linedc[21:].split()
-            #date data starts at column 12(11) ends at 20 
-            dateraw = linedc[11:20]
-            dateactual = ( dateraw[:4] + "-" + dateraw[4:6] + "-" + dateraw[6:8]
-                        )
-                
-            for j,item in enumerate(tideheights):
-                #check for bad data 
-                if int(item) == 9999 or int(item) == -9999:
-                    continue
-                datakey = dateactual
-                if dateraw[8] == "1":
-                    datakey += " %02d" %(j) + ":00:00"
-                else:
-                    datakey += " %02d" %(j + 12) + ":00:00"
-                data = float(item)/1000
-                datalist.append([datakey, data])
-        fdat.close()
-    return datalist
-
-def output_to_file(datalist):
-    """Outputs the processed datadict to a textfile
+    if sio is None:
+        sio = ftp_helpers.get_file(constants.FTP_BASE,
+                                   get_data_file(ftpurl, loc_code))
+    times = []
+    heights = []
+    #try to open the downloaded zip archive
+    try:
+        zarchive = zipfile.ZipFile(sio)
+    except zipfile.BadZipfile:
+        print("Could not open zip archive")
+        sys.exit()
+
+    with zarchive:
+        index = unhw_members(zarchive.namelist())
+        for year in years:
+            year = _unhw_year(year, index)
+            if year not in index:
+                print("No data file for %i in the archive"%year)
+                sys.exit()
+            datfile = index[year]
+            print("Opening data file:%s"%datfile)
+            #only one year of the archive is held in memory at a time
+            try:
+                raw = zarchive.read(datfile)
+            except RuntimeError:
+                print('RuntimeError')
+                sys.exit()
+
+            t, h, valid = parse_unhw_dat(raw)
+            times.append(t[valid])
+            heights.append(h[valid])
+    return np.concatenate(times), np.concatenate(heights)
+
+def output_to_file(data):
+    """Outputs the processed data to a textfile
     
         Mainly used for debugging purposes
     """
-    f2 = open("unhw_processed.dat", "w")
-    for item in datalist:
-       print("%s %s" %(item[0], item[1]), file = f2)
-    f2.close()
+    times, heights = data
+    with open("unhw_processed.dat", "w") as f2:
+        for time, height in zip(times.astype("datetime64[s]").astype(str),
+                                heights):
+            print("%s %s" %(time.replace("T", " "), height), file = f2)
 
-def fit_model(datalist):
+def fit_model(data):
     """Fits harmonic model to tides using pytides
-    """
 
-    t = []
-    heights = []
-    for dt, height in datalist:
-        #print(line.split()[:2])
-        t.append(datetime.datetime.strptime(dt, "%Y-%m-%d %H:%M:%S"))
-        heights.append(float(height))
+    data is the (times, heights) tuple returned by process_unhw_data, or a
+    list of ["%Y-%m-%d %H:%M:%S", height] pairs.
+    """
+    if isinstance(data, tuple):
+        times, heights = data
+    else:
+        times = np.array([dt for dt, _ in data], dtype = "datetime64[s]")
+        heights = np.array([height for _, height in data], dtype = float)
 
     ##Fit the tidal data to the harmonic model using Pytides
     print("Fitting harmonic model")
-    #print(heights[:5])
-    #print(t[:5])
-    my_tide = Tide.decompose(np.array(heights), np.array(t))
+    my_tide = Tide.decompose(np.asarray(heights, dtype = float),
+                             np.asarray(times), method='linear')
     return my_tide
 
 def output_html(my_tide, month, year):
@@ -257,6 +356,7 @@ def output_html(my_tide, month, year):
     #get the current working directory - this is useful on windows machines
     mydir = pathlib.Path.home()
     print(mydir)
+    from jinja2 import Environment, FileSystemLoader
     env = Environment(loader=FileSystemLoader(mydir),trim_blocks=True)
     template = env.get_template('template.html')
     with open(mydir / "output.html", "w") as fh:
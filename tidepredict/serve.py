@@ -0,0 +1,283 @@
+"""
+Long running prediction server.
+
+python -m tidepredict serve [-host HOST] [-port PORT] [-socket PATH]
+
+The station index and the harmonic models are loaded once and kept in
+memory, and the node factors of requests starting in the coming days are
+prepared at startup (see cache.node_factors), so that each request only
+evaluates the tide. Requests are HTTP GETs
+answered with JSON:
+
+/stations?q=NAME                    stations matching a name
+/heights?station=NAME&b=&e=&step=   heights every step minutes (default 10)
+/extrema?station=NAME&b=&e=         high and low tides
+/text?station=NAME&b=&e=&f=t|c      the text or csv output of -m p
+
+b and e are local station times formatted YYYY-MM-DD HH:MM, with the same
+defaults as the -b and -e options. station may also be a station code.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import sys
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from tidepredict import (constants, genharm, harmstore, processdata,
+                         stationindex, timefunc)
+
+#Default port to listen on
+PORT = 8372
+#Largest number of heights returned by one request
+MAX_HEIGHTS = 100000
+
+class RequestError(Exception):
+    """An error answered with an HTTP status and a JSON message"""
+
+    def __init__(self, status, message, **extra):
+        Exception.__init__(self, message)
+        self.status = status
+        self.body = dict(extra, error = message)
+
+class PredictionServer:
+    """Answers prediction requests from models held in memory.
+
+    index: stationindex.StationIndex
+    store: harmstore.HarmonicStore the models are loaded from
+    """
+
+    def __init__(self, index, store):
+        self.index = index
+        self.store = store
+        self.codes = {genharm.station_code(s) for s in index}
+        self.models = {}
+        self.routes = {"/stations": self.stations,
+                       "/heights": self.heights,
+                       "/extrema": self.extrema,
+                       "/text": self.text}
+
+    def preload(self, days = constants.TEXTSPAN):
+        """Loads every stored model and prepares the node factors and
+        equilibrium arguments of requests for up to days which start in the
+        coming days
+        """
+        now = datetime.datetime.now(datetime.timezone.utc).replace(
+            second = 0, microsecond = 0)
+        span = datetime.timedelta(days = days)
+        for loc_code in self.store.codes():
+            _, tide = self.model(loc_code)
+            #they are cached on a daily grid of times (see Tide._prepare), so
+            #a window starting each day covers requests starting at any time
+            for day in range(days + 1):
+                start = now + datetime.timedelta(days = day)
+                list(tide.extrema(start, start + span))
+                tide.at([start, start + span])
+        return len(self.models)
+
+    def model(self, loc_code):
+        """Returns (station information, Tide) of a station code"""
+        try:
+            return self.models[loc_code]
+        except KeyError:
+            record = self.store.load(loc_code)
+            if record is None:
+                raise RequestError(404, "Harmonics data not found for %s"
+                                   % loc_code)
+            self.models[loc_code] = record
+            return record
+
+    def station(self, query):
+        """Returns (station information, Tide, Tidetime) for a request"""
+        name = _param(query, "station")
+        if name.lower() in self.codes:
+            loc_code = name.lower()
+        else:
+            found = self.index.search(name, fuzzy = False)
+            if not found:
+                #a misspelt name is only used if it can only mean one station
+                closest = self.index.closest(name)
+                if closest is None:
+                    raise RequestError(404, "Station not found", stations =
+                                       [s['loc_name'] for s in
+                                        self.index.similar(name)])
+                found = [closest]
+            if len(found) > 1:
+                raise RequestError(409, "Station name ambiguous",
+                                   stations = [s['loc_name'] for s in found])
+            loc_code = genharm.station_code(found[0])
+        station, tide = self.model(loc_code)
+        times = {}
+        for key in ("b", "e"):
+            value = query.get(key, [None])[0]
+            if value is not None:
+                try:
+                    datetime.datetime.strptime(value, "%Y-%m-%d %H:%M")
+                except ValueError:
+                    raise RequestError(400, "%s must be formatted "
+                                       "YYYY-MM-DD HH:MM" % key)
+            times[key] = value
+        timeobj = timefunc.Tidetime(st_time = times["b"], en_time = times["e"],
+                                    station_tz = station['tzone'])
+        if timeobj.en_utc < timeobj.st_utc:
+            raise RequestError(400, "e must not be before b")
+        return dict(station, code = loc_code), tide, timeobj
+
+    def stations(self, query):
+        found = self.index.search(_param(query, "q"))
+        return {"stations": [dict(s, code = genharm.station_code(s))
+                             for s in found]}
+
+    def heights(self, query):
+        station, tide, timeobj = self.station(query)
+        try:
+            step = float(query.get("step", ["10"])[0])
+        except ValueError:
+            step = 0
+        if not step > 0:
+            raise RequestError(400, "step must be a positive number of minutes")
+        start = np.datetime64(timeobj.st_utc.replace(tzinfo = None), "s")
+        end = np.datetime64(timeobj.en_utc.replace(tzinfo = None), "s")
+        step = np.timedelta64(int(round(step * 60)), "s")
+        if (end - start) // step >= MAX_HEIGHTS:
+            raise RequestError(400, "at most %i heights may be requested"
+                               % MAX_HEIGHTS)
+        times = np.arange(start, end + step // 2, step)
+        return {"station": station, "tz": str(timeobj.tz),
+                "times": np.datetime_as_string(times, unit = "m",
+                                               timezone = "UTC").tolist(),
+                "heights": np.round(tide.at(times), 3).tolist()}
+
+    def extrema(self, query):
+        station, tide, timeobj = self.station(query)
+        extrema = []
+        for time, height, kind in tide.extrema(timeobj.st_utc, timeobj.en_utc):
+            extrema.append({
+                "time": time.astimezone(datetime.timezone.utc)
+                            .strftime("%Y-%m-%dT%H:%MZ"),
+                "local": timeobj.localise(time).strftime("%Y-%m-%d %H:%M"),
+                "height": round(float(height), 3),
+                "type": "High" if kind == "H" else "Low"})
+        return {"station": station, "tz": str(timeobj.tz),
+                "extrema": extrema}
+
+    def text(self, query):
+        station, tide, timeobj = self.station(query)
+        form = query.get("f", ["t"])[0]
+        if form not in ("t", "c"):
+            raise RequestError(400, "f must be t or c")
+        return {"station": station,
+                "text": processdata.predict_plain(tide, station, form,
+                                                  timeobj)}
+
+    def respond(self, target):
+        """Returns (status, body) for a request target (path and query)"""
+        url = urlsplit(target)
+        try:
+            route = self.routes.get(url.path.rstrip("/") or "/")
+            if route is None:
+                raise RequestError(404, "Unknown path %s" % url.path,
+                                   paths = sorted(self.routes))
+            return 200, route(parse_qs(url.query))
+        except RequestError as err:
+            return err.status, err.body
+        except Exception as err:
+            return 500, {"error": "%s: %s" % (type(err).__name__, err)}
+
+    async def handle(self, reader, writer):
+        """Serves the HTTP requests of one connection"""
+        try:
+            while True:
+                request = await reader.readline()
+                if not request.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request.decode("latin-1").split()
+                except ValueError:
+                    status, body = 400, {"error": "Bad request"}
+                    version = "HTTP/1.0"
+                else:
+                    if method == "GET":
+                        status, body = self.respond(target)
+                    else:
+                        status, body = 405, {"error": "Only GET is supported"}
+                close = (headers.get("connection", "").lower() == "close" or
+                         version != "HTTP/1.1")
+                data = json.dumps(body).encode()
+                writer.write(("HTTP/1.1 %i %s\r\n"
+                              "Content-Type: application/json\r\n"
+                              "Content-Length: %i\r\n"
+                              "Connection: %s\r\n\r\n"
+                              % (status, _REASONS.get(status, ""), len(data),
+                                 "close" if close else "keep-alive"))
+                             .encode() + data)
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 409: "Conflict",
+            500: "Internal Server Error"}
+
+def _param(query, key):
+    try:
+        return query[key][0]
+    except KeyError:
+        raise RequestError(400, "Missing parameter %s" % key)
+
+async def start(server, host = "127.0.0.1", port = PORT, socket = None):
+    """Starts serving on a TCP port, or a Unix socket if socket is given"""
+    if socket is not None:
+        return await asyncio.start_unix_server(server.handle, path = socket)
+    return await asyncio.start_server(server.handle, host, port)
+
+parser = argparse.ArgumentParser(prog = "tidepredict serve",
+                                 description = "tidepredict: serve tide "
+                                               "predictions over HTTP.")
+parser.add_argument('-host',
+                    action="store",
+                    help="Address to listen on. The default is 127.0.0.1.",
+                    default="127.0.0.1")
+parser.add_argument('-port',
+                    action="store",
+                    type=int,
+                    help="Port to listen on. The default is %i." % PORT,
+                    default=PORT)
+parser.add_argument('-socket',
+                    action="store",
+                    help="Listen on this Unix socket instead of a port",
+                    metavar="PATH")
+
+def main(argv = None):
+    args = parser.parse_args(argv)
+    server = PredictionServer(stationindex.get_index(),
+                              harmstore.HarmonicStore())
+    print("Loaded %i station models" % server.preload())
+
+    async def serve():
+        listener = await start(server, args.host, args.port, args.socket)
+        print("Serving on %s" % (args.socket or
+                                 "http://%s:%i" % (args.host, args.port)))
+        sys.stdout.flush()
+        async with listener:
+            await listener.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.store.close()
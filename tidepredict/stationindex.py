@@ -0,0 +1,156 @@
+"""
+Prebuilt index of the station list for looking stations up by name.
+
+The index is built whenever the station list is refreshed and pickled next
+to stations.csv. Names are normalized (case, accents and punctuation are
+ignored) and every suffix of every normalized name is kept in a sorted list,
+so finding the stations whose name contains a string is a binary search.
+"""
+import bisect
+import csv
+import difflib
+import pickle
+import re
+import unicodedata
+
+from tidepredict import constants
+
+#Version of the pickled index, an index with another version is rebuilt
+INDEX_VERSION = 2
+#Station list columns kept in the index
+FIELDS = ["stat_idx", "oc_idx", "loc_name", "country", "Lat", "Lon",
+          "data_years", "Contributor", "tzone"]
+#Similarity above which the only station with a similar name is taken to
+#be a misspelling of the name searched for
+CLOSE_CUTOFF = 0.9
+
+def normalize(name):
+    """Lower case words of a name without accents or punctuation"""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return " ".join(re.findall(r"[0-9a-z]+", name.lower()))
+
+class StationIndex:
+    """Stations of the station list searchable by name.
+
+    stations: list of dictionaries with the FIELDS of each station
+    """
+
+    def __init__(self, stations):
+        self.stations = [{field: _text(station.get(field)) for field in FIELDS}
+                         for station in stations]
+        self.names = [normalize(station["loc_name"])
+                      for station in self.stations]
+        suffixes = sorted((name[i:], n) for n, name in enumerate(self.names)
+                          for i in range(len(name)) if name[i] != " ")
+        self.suffixes = [suffix for suffix, _ in suffixes]
+        self.owners = [n for _, n in suffixes]
+
+    def search(self, name, fuzzy = True):
+        """Returns the stations whose name contains name.
+
+        Stations whose whole name matches are preferred over those which
+        only contain it. If nothing matches and fuzzy is True the stations
+        with the most similar names are returned instead.
+        """
+        query = normalize(name)
+        if not query:
+            return []
+        lo = bisect.bisect_left(self.suffixes, query)
+        hi = bisect.bisect_left(self.suffixes, query + "\uffff", lo)
+        found = sorted(set(self.owners[lo:hi]))
+        exact = [n for n in found if self.names[n] == query]
+        if exact:
+            found = exact
+        elif not found and fuzzy:
+            return self.similar(name)
+        return [self.stations[n] for n in found]
+
+    def similar(self, name, n = 5, cutoff = 0.75):
+        """Returns the stations whose names are among the n most similar to
+        name, with a similarity of at least cutoff
+        """
+        close = set(difflib.get_close_matches(normalize(name),
+                                              set(self.names),
+                                              n = n, cutoff = cutoff))
+        return [self.stations[i] for i, station_name in enumerate(self.names)
+                if station_name in close]
+
+    def closest(self, name):
+        """Returns the station name is taken to be a misspelling of, or None.
+        That is the only station with a similar name, if its similarity is
+        at least CLOSE_CUTOFF.
+        """
+        found = self.similar(name)
+        if len(found) == 1 and self.similar(name, cutoff = CLOSE_CUTOFF):
+            return found[0]
+        return None
+
+    def save(self, path = None):
+        if path is None:
+            path = constants.STATIONINDEX
+        path.parent.mkdir(parents = True, exist_ok = True)
+        state = {"version": INDEX_VERSION, "stations": self.stations,
+                 "names": self.names, "suffixes": self.suffixes,
+                 "owners": self.owners}
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol = pickle.HIGHEST_PROTOCOL)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path = None):
+        """Loads a saved index, returns None if there is no usable index"""
+        if path is None:
+            path = constants.STATIONINDEX
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if not isinstance(state, dict) \
+                or state.get("version") != INDEX_VERSION:
+            return None
+        index = cls.__new__(cls)
+        del state["version"]
+        index.__dict__.update(state)
+        return index
+
+    @classmethod
+    def from_csv(cls, path = None):
+        """Builds the index from a stations.csv file"""
+        if path is None:
+            path = constants.STATIONFILE
+        with open(path, newline = "") as f:
+            return cls(list(csv.DictReader(f)))
+
+    def __len__(self):
+        return len(self.stations)
+
+    def __iter__(self):
+        return iter(self.stations)
+
+def _text(value):
+    """Station list values as strings, with missing values empty"""
+    if value is None or value != value:
+        return ""
+    return str(value)
+
+def get_index(refresh = False):
+    """Returns the station index.
+
+    The saved index is used unless refresh is True. Otherwise it is rebuilt
+    from stations.csv, or the station list is downloaded again if there is
+    no stations.csv either.
+    """
+    index = None if refresh else StationIndex.load()
+    if index is None and not refresh and constants.STATIONFILE.exists():
+        index = StationIndex.from_csv()
+        index.save()
+    if index is None:
+        #the station list is only downloaded (with pandas) when needed
+        from tidepredict import process_station_list
+        print("Refreshing stations list from online source.")
+        process_station_list.create_station_dataframe()
+        index = StationIndex.load()
+    return index
@@ -1,4 +1,5 @@
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+import copy
 #below for compatibility with Python < 3.8
 try:
     from collections.abc import Iterable # noqa
@@ -10,20 +11,38 @@ try:
 except ImportError: #Python3
 	izip = zip
 	ifilter = filter
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import numpy as np
-from scipy.optimize import leastsq, fsolve
-from tidepredict.astro import astro
+from tidepredict.astro import astro, astro_array, astro_parameters, JD_array
 import tidepredict.constituent as constituent
+from tidepredict import cache
+from tidepredict import extrematable
 
 d2r, r2d = np.pi/180.0, 180.0/np.pi
 
+PartitionError = namedtuple('PartitionError', ['height', 'time'])
+
 class Tide(object):
 	dtype = np.dtype([
 		('constituent', object),
 		('amplitude', float),
 		('phase', float)])
 
+	#Number of samples for which the cosine arguments of all constituents are
+	#held in memory at once when evaluating a tidal series
+	block = 4096
+	#Number of samples generated by phasor rotation between re-anchorings
+	#to the directly evaluated phase, for uniformly spaced series
+	anchor = 512
+	#Number of hours over which node factors are considered constant by at
+	#and decompose, and by extrema.  These may be set on the class or on an
+	#instance to trade accuracy for speed; see Tide.partition_error.
+	partition = 240.0
+	extrema_partition = 2400.0
+	#Whether at interpolates the node factors linearly across each partition
+	#rather than holding them at their value at its midpoint
+	interpolate = False
+
 	def __init__(
 			self,
 			constituents = None,
@@ -63,7 +82,7 @@ class Tide(object):
 		return Tide._prepare(self.model['constituent'], *args, **kwargs)
 
 	@staticmethod
-	def _prepare(constituents, t0, t = None, radians = True):
+	def _prepare(constituents, t0, t = None, radians = True, partition = None):
 		"""
 		Return constituent speed and equilibrium argument at a given time, and constituent node factors at given times.
 		Arguments:
@@ -71,6 +90,11 @@ class Tide(object):
 		t0 -- time at which to evaluate speed and equilibrium argument for each constituent
 		t -- list of times at which to evaluate node factors for each constituent (default: t0)
 		radians -- whether to return the angular arguments in radians or degrees (default: True)
+		partition -- hours over which the node factors are taken to be constant.
+		             They are then evaluated at the nearest of a grid of times a
+		             tenth of this apart (at most cache.UF_GRID hours), which
+		             windows starting at different times share (default: evaluate
+		             at exactly t)
 		"""
 		#The equilibrium argument is constant and taken at the beginning of the
 		#time series (t0).  The speed of the equilibrium argument changes very
@@ -82,16 +106,18 @@ class Tide(object):
 			t = [t0]
 		if not isinstance(t, Iterable):
 			t = [t]
-		a0 = astro(t0)
-		a = [astro(t_i) for t_i in t]
-
-		#For convenience give u, V0 (but not speed!) in [0, 360)
-		V0 = np.array([c.V(a0) for c in constituents])[:, np.newaxis]
-		speed = np.array([c.speed(a0) for c in constituents])[:, np.newaxis]
-		u = [np.mod(np.array([c.u(a_i) for c in constituents])[:, np.newaxis], 360.0)
-			 for a_i in a]
-		f = [np.mod(np.array([c.f(a_i) for c in constituents])[:, np.newaxis], 360.0)
-			 for a_i in a]
+		if partition is None:
+			step = cache.JD_QUANTUM
+		else:
+			step = min(cache.UF_GRID, 0.1*partition) / 24.0
+		#Astronomical parameters for all of the times in a single pass, the
+		#arguments and node factors of every constituent then follow from the
+		#precompiled constituent set without looping over constituents.
+		cs = constituent.ConstituentSet.of(constituents)
+		speed, V0 = Tide._arguments(cs, JD_array([t0])[0])
+		u, f = Tide._node_factors(cs, JD_array(t), step)
+		u = [u_i[:, np.newaxis] for u_i in u.T]
+		f = [f_i[:, np.newaxis] for f_i in f.T]
 
 		if radians:
 			speed = d2r*speed
@@ -99,25 +125,157 @@ class Tide(object):
 			u = [d2r*each for each in u]
 		return speed, u, f, V0
 
-	def at(self, t):
+	@staticmethod
+	def _grid(jd, step):
+		"""
+		Return the indices and Julian Dates of the nearest points of a grid of
+		Julian Dates step days apart, aligned with midnight UTC.
+		"""
+		n = np.round((np.asarray(jd, dtype = float) - 0.5) / step)
+		return n.astype(np.int64), 0.5 + n*step
+
+	@staticmethod
+	def _arguments(cs, jd0):
+		"""
+		Return the speeds and equilibrium arguments in degrees, as (n, 1)
+		arrays, of a constituent set at a Julian Date.  They are cached at the
+		nearest of a grid of times cache.V0_GRID hours apart, and V0 is carried
+		on from there to jd0 at the constituent speeds.
+		"""
+		n, jd_ref = Tide._grid(jd0, cache.V0_GRID / 24.0)
+		key = ('V0', cs.key, int(n))
+		prepared = cache.node_factors.get(key)
+		if prepared is None:
+			values, speeds = astro_array([jd_ref])
+			prepared = (cs.speed(speeds), cs.V(values))
+			for each in prepared:
+				each.setflags(write = False)
+			cache.node_factors.put(key, prepared)
+		speed, V_ref = prepared
+		#For convenience give V0 (but not speed!) in [0, 360)
+		return speed, np.mod(V_ref + speed*(24.0*(jd0 - jd_ref)), 360.0)
+
+	@staticmethod
+	def _node_factors(cs, jd, step = cache.JD_QUANTUM):
+		"""
+		Return the node factors u (in degrees) and f, as (n, m) arrays, of a
+		constituent set at the nearest points of a grid of Julian Dates step
+		days apart to m Julian Dates.  Only the dates missing from the cache
+		are passed to astro_array, in a single batch.
+		"""
+		n, jd = Tide._grid(jd, step)
+		keys = [('uf', cs.key, step, n_i) for n_i in n.tolist()]
+		prepared = [cache.node_factors.get(key) for key in keys]
+		missing = [i for i, each in enumerate(prepared) if each is None]
+		if missing:
+			a = astro_parameters(*astro_array(jd[missing]))
+			#For convenience give u in [0, 360)
+			u, f = np.mod(cs.u(a), 360.0), np.mod(cs.f(a), 360.0)
+			for k, i in enumerate(missing):
+				prepared[i] = (u[:, k], f[:, k])
+				for each in prepared[i]:
+					each.setflags(write = False)
+				cache.node_factors.put(keys[i], prepared[i])
+		if not prepared:
+			shape = (len(cs), 0)
+			return np.zeros(shape), np.zeros(shape)
+		return (np.array([each[0] for each in prepared]).T,
+		        np.array([each[1] for each in prepared]).T)
+
+	def at(self, t, out = None, dtype = float, uniform = None):
 		"""
 		Return the modelled tidal height at given times.
 		Arguments:
-		t -- array of times at which to evaluate the tidal height
+		t -- array of times at which to evaluate the tidal height; datetimes,
+		     numpy datetime64 (UTC), a pandas DatetimeIndex or an ndarray of
+		     Unix epoch seconds
+		out -- optional ndarray, of the same length as t, in which to write the heights
+		dtype -- dtype of the returned heights when out is not given (default: float)
+		uniform -- whether t is uniformly spaced, in which case each constituent
+		           is generated by complex rotation rather than evaluating a
+		           cosine per sample (default: detect from t)
 		"""
+		t64 = Tide._datetime64(t, epoch = True)
+		if t64 is not None:
+			t = t64
 		t0 = t[0]
 		hours = self._hours(t0, t)
-		partition = 240.0
+		partition = self.partition
 		t = self._partition(hours, partition)
-		times = self._times(t0, [(i + 0.5)*partition for i in range(len(t))])
-		speed, u, f, V0 = self.prepare(t0, times, radians = True)
+		if self.interpolate:
+			#Node factors at the boundaries of each partition, with u unwrapped
+			#so that it can be interpolated through 360 degrees
+			times = self._times(t0, [i*partition for i in range(len(t) + 1)])
+			speed, u, f, V0 = self.prepare(t0, times, radians = True, partition = partition)
+			u = list(np.unwrap(np.hstack(u), axis = 1).T[:, :, np.newaxis])
+		else:
+			times = self._times(t0, [(i + 0.5)*partition for i in range(len(t))])
+			speed, u, f, V0 = self.prepare(t0, times, radians = True, partition = partition)
 		H = self.model['amplitude'][:, np.newaxis]
 		p = d2r*self.model['phase'][:, np.newaxis]
 
-		return np.concatenate([
-			Tide._tidal_series(t_i, H, p, speed, u_i, f_i, V0)
-			for t_i, u_i, f_i in izip(t, u, f)
-		])
+		if out is None:
+			out = np.empty(len(hours), dtype = dtype)
+		elif out.shape != hours.shape:
+			raise ValueError("out must have the same length as t")
+		if uniform is None:
+			uniform = Tide._uniform(hours)
+		#Each partition is a view of hours, so is written in place at the
+		#offset given by the lengths of the preceding partitions.
+		work = np.empty((len(H), min(Tide.block, len(hours))))
+		start = 0
+		for i, (t_i, u_i, f_i) in enumerate(izip(t, u, f)):
+			out_i = out[start:start + len(t_i)]
+			if self.interpolate:
+				Tide._tidal_series(t_i, H, p, speed, u_i, f_i, V0, out = out_i, work = work,
+					du = (u[i + 1] - u_i) / partition, df = (f[i + 1] - f_i) / partition,
+					t_ref = i*partition)
+			elif uniform and len(t_i) > 1:
+				Tide._phasor_series(t_i, hours[1] - hours[0], H, p, speed, u_i, f_i, V0, out = out_i)
+			else:
+				Tide._tidal_series(t_i, H, p, speed, u_i, f_i, V0, out = out_i, work = work)
+			start += len(t_i)
+		return out
+
+	def partition_error(self, t0, t1, reference = 1.0, step = 0.1, **settings):
+		"""
+		Return the maximum errors in height (of Tide.at) and in time (hours,
+		of Tide.extrema) between t0 and t1 when node factors are computed with
+		the given settings, compared with a reference which recomputes them
+		every reference hours.
+		Arguments:
+		t0, t1 -- datetimes between which to compare
+		reference -- partition length in hours of the reference (default: 1.0)
+		step -- spacing in hours at which heights are compared (default: 0.1)
+		settings -- values of partition, extrema_partition and interpolate to
+		            evaluate (default: those of this model)
+		"""
+		model = copy.copy(self)
+		for name, value in settings.items():
+			if name not in ('partition', 'extrema_partition', 'interpolate'):
+				raise TypeError("Unknown setting: %s" % name)
+			setattr(model, name, value)
+		fine = copy.copy(self)
+		fine.partition = fine.extrema_partition = reference
+		fine.interpolate = False
+
+		times = Tide._times(t0, np.arange(0, Tide._hours(t0, t1), step))
+		height = np.amax(np.abs(model.at(times) - fine.at(times)))
+		ours = np.array([Tide._hours(t0, e[0]) for e in model.extrema(t0, t1)])
+		theirs = np.array([Tide._hours(t0, e[0]) for e in fine.extrema(t0, t1)])
+		nearest = np.clip(np.searchsorted(theirs, ours), 1, len(theirs) - 1)
+		time = np.amax(np.minimum(np.abs(ours - theirs[nearest - 1]), np.abs(ours - theirs[nearest])))
+		return PartitionError(height, time)
+
+	def phasor_error(self, t):
+		"""
+		Return the maximum absolute difference between the heights at
+		uniformly spaced times t generated by phasor rotation and those
+		evaluated directly.
+		Arguments:
+		t -- uniformly spaced array of times, as for Tide.at
+		"""
+		return np.amax(np.abs(self.at(t, uniform = True) - self.at(t, uniform = False)))
 
 	def highs(self, *args):
 		"""
@@ -161,58 +319,152 @@ class Tide(object):
 		else:
 			return 'diurnal'
 
-	def extrema(self, t0, t1 = None, partition = 2400.0):
+	def extrema(self, t0, t1 = None, partition = None, tables = True):
 		"""
 		A generator for high and low tides.
 		Arguments:
 		t0 -- time after which extrema are sought
 		t1 -- optional time before which extrema are sought (if not given, the generator is infinite)
-		partition -- number of hours for which we consider the node factors to be constant (default: 2400.0)
+		partition -- number of hours for which we consider the node factors to be constant (default: self.extrema_partition)
+		tables -- whether to look the extrema up in a precomputed table covering t0 to t1, if there is one (default: True); see extrematable
 		"""
+		if t1 and tables and partition is None:
+			table = extrematable.find(self, t0, t1)
+			if table is not None:
+				for e in table.between(t0, t1):
+					yield e
+				return
+		if partition is None:
+			partition = self.extrema_partition
 		if t1:
 			#yield from in python 3.4
-			for e in takewhile(lambda t: t[0] < t1, self.extrema(t0)):
+			for e in takewhile(lambda t: t[0] < t1, self.extrema(t0, partition = partition)):
 				yield e
 		else:
-			#We assume that extrema are separated by at least delta hours
-			delta = np.amin([
-				90.0 / c.speed(astro(t0)) for c in self.model['constituent']
-				if not c.speed(astro(t0)) == 0
-			])
 			#We search for stationary points from offset hours before t0 to
 			#ensure we find any which might occur very soon after t0.
 			offset = 24.0
-			partitions = (
-				Tide._times(t0, i*partition) for i in count()), (Tide._times(t0, i*partition) for i in count(1)
-			)
-
-			#We'll overestimate to be on the safe side;
-			#values outside (start,end) won't get yielded.
-			interval_count = int(np.ceil((partition + offset) / delta)) + 1
 			amplitude = self.model['amplitude'][:, np.newaxis]
 			phase     = d2r*self.model['phase'][:, np.newaxis]
+			#Partitions are stepped through as datetime64 (taking the fields
+			#of a datetime t0, as JD does); only the extrema yielded are
+			#converted back to the type of t0.
+			if isinstance(t0, np.datetime64):
+				t0_64 = t0
+			else:
+				t0_64 = np.datetime64(t0.replace(tzinfo = None), 'us')
+			cs = constituent.ConstituentSet.of(self.model['constituent'])
+			uf_step = min(cache.UF_GRID, 0.1*self.partition) / 24.0
+
+			for i in count():
+				start = Tide._times(t0_64, i*partition)
+				speed, [u], [f], V0 = self.prepare(start, Tide._times(start, 0.5*partition), partition = partition)
+				if i == 0:
+					#We assume that extrema are separated by at least delta hours
+					delta = np.amin(0.5*np.pi / speed[speed > 0])
+					#We'll overestimate to be on the safe side;
+					#values outside (start,end) won't get yielded.
+					grid = delta * np.arange(int(np.ceil((partition + offset) / delta)) + 2) - offset
+					dg = np.empty((2, len(grid)))
+				hours, curvature = Tide._stationary_points(grid, amplitude, phase, speed, u, f, V0, dg = dg)
+				inside = (0 < hours) & (hours < partition)
+				hours, curvature = hours[inside], curvature[inside]
+				if len(hours) == 0:
+					continue
+				#The heights take the node factors on the grid of at() nearest
+				#each extremum, as u changes too much over a whole partition
+				#for some constituents (M1 by up to 190 degrees)
+				_, jd = Tide._grid(JD_array([start])[0] + hours/24.0, uf_step)
+				jd, nearest = np.unique(jd, return_inverse = True)
+				u_h, f_h = Tide._node_factors(cs, jd, uf_step)
+				arg = speed*hours + V0 + d2r*u_h[:, nearest] - phase
+				heights = np.sum(amplitude*f_h[:, nearest]*np.cos(arg), axis = 0)
+				hours = hours + i*partition
+				if isinstance(t0, np.datetime64):
+					times = Tide._times(t0, hours)
+				else:
+					offsets = np.round(hours * 3.6e9).astype('timedelta64[us]')
+					times = [t0 + each for each in offsets.tolist()]
+				for time, height, d2 in izip(times, heights.tolist(), curvature):
+					yield (time, height, 'H' if d2 < 0 else 'L')
 
-			for start, end in izip(*partitions):
-				speed, [u], [f], V0 = self.prepare(start, Tide._times(start, 0.5*partition))
-				#These derivatives don't include the time dependence of u or f,
-				#but these change slowly.
-				def d(t):
-					return np.sum(-speed*amplitude*f*np.sin(speed*t + (V0 + u) - phase), axis=0)
-				def d2(t):
-					return np.sum(-speed**2.0 * amplitude*f*np.cos(speed*t + (V0 + u) - phase), axis=0)
-				#We'll overestimate to be on the safe side;
-				#values outside (start,end) won't get yielded.
-				intervals = (
-					delta * i -offset for i in range(interval_count)), (delta*(i+1) - offset for i in range(interval_count)
-				)
-				for a, b in izip(*intervals):
-					if d(a)*d(b) < 0:
-						extrema = fsolve(d, (a + b) / 2.0, fprime = d2)[0]
-						time = Tide._times(start, extrema)
-						[height] = self.at([time])
-						hilo = 'H' if d2(extrema) < 0 else 'L'
-						if start < time < end:
-							yield (time, height, hilo)
+	@staticmethod
+	def _stationary_points(grid, amplitude, phase, speed, u, f, V0, tolerance = 1e-6, dg = None):
+		"""
+		Return the hours at which the tidal series has a stationary point, and
+		its second derivative there, for every sign change of the derivative
+		between successive hours of grid.  Every root is refined at once by
+		Newton's method, bisecting whenever a step leaves its bracket.
+		Arguments:
+		grid -- uniformly spaced ndarray of hours
+		amplitude, phase, speed, u, f, V0 -- (n, 1) arrays as in _tidal_series
+		tolerance -- convergence tolerance in hours (default: 1e-6)
+		dg -- optional (2, len(grid)) ndarray for the first and second
+		      derivatives on the grid
+		"""
+		#These derivatives don't include the time dependence of u or f,
+		#but these change slowly.
+		#Each evaluation takes one sine and cosine per constituent for the
+		#first three derivatives.
+		offset = V0 + u - phase
+		w1 = (-speed*amplitude*f)[:, 0]
+		w2, w3 = speed[:, 0]*w1, -speed[:, 0]**2*w1
+		def derivatives(t):
+			arg = speed*t + offset
+			sine = np.sin(arg)
+			return np.dot(w1, sine), np.dot(w2, np.cos(arg)), np.dot(w3, sine)
+
+		#The first and second derivatives are tidal series of amplitudes
+		#speed*amplitude and speed**2*amplitude advanced a quarter and a half
+		#period, generated by phasor rotation on the grid
+		spacing = grid[1] - grid[0]
+		if dg is None:
+			dg = np.empty((2, len(grid)))
+		Tide._phasor_series(grid, spacing, speed*amplitude, phase - 0.5*np.pi, speed, u, f, V0, out = dg[0])
+		Tide._phasor_series(grid, spacing, speed**2*amplitude, phase - np.pi, speed, u, f, V0, out = dg[1])
+		[brackets] = np.nonzero(dg[0, :-1]*dg[0, 1:] < 0)
+		a, b = grid[brackets], grid[brackets + 1]
+		da, db = dg[0, brackets], dg[0, brackets + 1]
+		sa, sb = spacing*dg[1, brackets], spacing*dg[1, brackets + 1]
+		#Start from the root of the cubic through the derivative and second
+		#derivative at each end of each bracket, found by Newton's method
+		#from the secant
+		s = da/(da - db)
+		for _ in range(3):
+			s2, s3 = s*s, s*s*s
+			p = (2*s3 - 3*s2 + 1)*da + (s3 - 2*s2 + s)*sa + (3*s2 - 2*s3)*db + (s3 - s2)*sb
+			dp = (6*s2 - 6*s)*(da - db) + (3*s2 - 4*s + 1)*sa + (3*s2 - 2*s)*sb
+			with np.errstate(divide = 'ignore', invalid = 'ignore'):
+				s = np.clip(s - p/dp, 0.0, 1.0)
+			s = np.where(np.isfinite(s), s, 0.5)
+		x = a + s*spacing
+		curvature = np.empty(len(x))
+		active = np.arange(len(x))
+		for _ in range(50):
+			if len(active) == 0:
+				break
+			x_a, a_a, b_a = x[active], a[active], b[active]
+			d, d2, d3 = derivatives(x_a)
+			#The curvature at a root is that of its last evaluation, within
+			#tolerance of where it converges
+			curvature[active] = d2
+			#Narrow each bracket around its root, bisecting whenever a Newton
+			#step would leave it.
+			same = np.sign(d) == np.sign(da[active])
+			a_a = np.where(same, x_a, a_a)
+			b_a = np.where(same, b_a, x_a)
+			with np.errstate(divide = 'ignore', invalid = 'ignore'):
+				step = x_a - d / d2
+				#Newton's method converges quadratically, a step of e leaves
+				#an error of about e**2*d3/(2*d2)
+				error = np.abs(0.5*d3/d2) * (step - x_a)**2
+			newton = (a_a <= step) & (step <= b_a)
+			step = np.where(newton, step, 0.5*(a_a + b_a))
+			x[active], a[active], b[active] = step, a_a, b_a
+			#Roots stop being iterated once they converge
+			converged = (np.abs(step - x_a) < tolerance) | (newton & (error < tolerance))
+			active = active[~converged]
+		return x, curvature
 
 	@staticmethod
 	def _hours(t0, t):
@@ -222,13 +474,36 @@ class Tide(object):
 		t0 -- time from which offsets are sought
 		t -- times to find hourly offsets from t0.
 		"""
-		if not isinstance(t, Iterable):
+		if isinstance(t, np.datetime64):
+			return Tide._hours(t0, np.array([t]))[0]
+		elif not isinstance(t, Iterable):
 			return Tide._hours(t0, [t])[0]
+		elif isinstance(t, np.ndarray) and t.dtype.kind == 'M':
+			return (t - t0) / np.timedelta64(1, 'h')
 		elif isinstance(t[0], datetime):
 			return np.array([(ti-t0).total_seconds() / 3600.0 for ti in t])
 		else:
 			return t
 
+	@staticmethod
+	def _datetime64(t, epoch = False):
+		"""
+		Return a datetime64[ns] (UTC) view of an array of times without
+		converting element by element, or None if t is not a datetime64 array
+		or pandas DatetimeIndex/Series.
+		Arguments:
+		t -- array of times
+		epoch -- whether to interpret numeric ndarrays as Unix epoch seconds (default: False)
+		"""
+		t = getattr(t, 'values', t)
+		if not isinstance(t, np.ndarray):
+			return None
+		if t.dtype.kind == 'M':
+			return t.astype('datetime64[ns]', copy = False)
+		if epoch and t.dtype.kind in 'iuf':
+			return np.round(t * 1e9).astype(np.int64).astype('datetime64[ns]')
+		return None
+
 	@staticmethod
 	def _partition(hours, partition = 3600.0):
 		"""
@@ -240,7 +515,8 @@ class Tide(object):
 		partition = float(partition)
 		relative = hours - hours[0]
 		total_partitions = np.ceil(relative[-1] / partition + 10*np.finfo(np.float64).eps).astype('int')
-		return [hours[np.floor(np.divide(relative, partition)) == i] for i in range(total_partitions)]
+		bounds = np.searchsorted(relative, partition * np.arange(total_partitions + 1))
+		return [hours[i:j] for i, j in izip(bounds[:-1], bounds[1:])]
 
 	@staticmethod
 	def _times(t0, hours):
@@ -252,14 +528,82 @@ class Tide(object):
 		"""
 		if not isinstance(hours, Iterable):
 			return Tide._times(t0, [hours])[0]
+		elif isinstance(t0, np.datetime64):
+			return t0 + np.round(np.asarray(hours) * 3.6e12).astype('timedelta64[ns]')
 		elif not isinstance(hours[0], datetime):
 			return np.array([t0 + timedelta(hours=h) for h in hours])
 		else:
 			return np.array(hours)
 
 	@staticmethod
-	def _tidal_series(t, amplitude, phase, speed, u, f, V0):
-		return np.sum(amplitude*f*np.cos(speed*t + (V0 + u) - phase), axis=0)
+	def _tidal_series(t, amplitude, phase, speed, u, f, V0, out = None, work = None,
+			du = None, df = None, t_ref = 0.0):
+		"""
+		Return the tidal series at hours t for constant node factors.  If out
+		is given the series is written into it, evaluating the cosines in
+		blocks of at most Tide.block samples (reusing work, an (n, block)
+		array, if given) so that the temporary memory is bounded.  If du and
+		df are given the node factors vary linearly, as u + du*(t - t_ref) and
+		f + df*(t - t_ref).
+		"""
+		if out is None:
+			return np.sum(amplitude*f*np.cos(speed*t + (V0 + u) - phase), axis=0)
+		scale = (amplitude*f)[:, 0]
+		offset = V0 + u - phase
+		if work is None:
+			work = np.empty((len(speed), min(Tide.block, len(t))))
+		block = work.shape[1]
+		for i in range(0, len(t), block):
+			t_i = t[i:i + block]
+			arg = work[:, :len(t_i)]
+			np.multiply(speed, t_i, out = arg)
+			arg += offset
+			if du is None:
+				np.cos(arg, out = arg)
+				out[i:i + len(t_i)] = np.dot(scale, arg)
+			else:
+				arg += du*(t_i - t_ref)
+				np.cos(arg, out = arg)
+				arg *= amplitude*(f + df*(t_i - t_ref))
+				out[i:i + len(t_i)] = np.sum(arg, axis = 0)
+		return out
+
+	@staticmethod
+	def _phasor_series(t, step, amplitude, phase, speed, u, f, V0, out):
+		"""
+		Write the tidal series at uniformly spaced hours t into out.  Each
+		constituent is advanced from sample to sample by one complex
+		multiplication by exp(i*speed*step), and re-anchored to its directly
+		evaluated phasor every Tide.anchor samples to limit the drift.
+		"""
+		n = len(t)
+		length = min(Tide.anchor, n)
+		#rotation[:, k] = exp(i*speed*step*k) by repeated multiplication
+		rotation = np.empty((len(speed), length), dtype = complex)
+		rotation[:, 0] = 1.0
+		rotation[:, 1:] = np.exp(1j*speed*step)
+		np.cumprod(rotation, axis = 1, out = rotation)
+		scale = amplitude*f
+		offset = V0 + u - phase
+		#Anchors are grouped so that at most Tide.block samples are held at once
+		group = length * max(1, Tide.block // length)
+		for i in range(0, n, group):
+			starts = t[i:i + group:length]
+			anchors = scale*np.exp(1j*(speed*starts + offset))
+			series = np.dot(anchors.T, rotation).real.ravel()
+			out[i:i + group] = series[:len(out[i:i + group])]
+		return out
+
+	@staticmethod
+	def _uniform(hours):
+		"""
+		Return whether an array of hours is uniformly spaced (to within a
+		millionth of its spacing).
+		"""
+		if len(hours) < 3:
+			return False
+		step = np.diff(hours)
+		return step[0] > 0 and np.amax(np.abs(step - step[0])) <= 1e-6*step[0]
 
 	def normalize(self):
 		"""
@@ -282,14 +626,15 @@ class Tide(object):
 			initial      = None,
 			n_period     = 2,
 			callback     = None,
-			full_output  = False
+			full_output  = False,
+			method       = 'nonlinear'
 		):
 		"""
 		Return an instance of Tide which has been fitted to a series of tidal observations.
 		Arguments:
 		It is not necessary to provide t0 or interval if t is provided.
 		heights -- ndarray of tidal observation heights
-		t -- ndarray of tidal observation times
+		t -- ndarray of tidal observation times (datetimes or datetime64)
 		t0 -- datetime representing the time at which heights[0] was recorded
 		interval -- hourly interval between readings
 		constituents -- list of constituents to use in the fit (default: constituent.noaa)
@@ -297,9 +642,19 @@ class Tide(object):
 		n_period -- only include constituents which complete at least this many periods (default: 2)
 		callback -- optional function to be called at each iteration of the solver
 		full_output -- whether to return the output of scipy's leastsq solver (default: False)
+		method -- 'nonlinear' to fit amplitudes and phases iteratively with leastsq,
+		          or 'linear' to solve for (H cos p, H sin p) in one linear least
+		          squares step (default: 'nonlinear').  A linear fit can be
+		          refined by passing it as initial to a nonlinear fit.
 		"""
+		if method not in ('linear', 'nonlinear'):
+			raise ValueError("method must be 'linear' or 'nonlinear'")
 		if t is not None:
-			if isinstance(t[0], datetime):
+			t64 = Tide._datetime64(t)
+			if t64 is not None:
+				hours = Tide._hours(t64[0], t64)
+				t0 = t64[0]
+			elif isinstance(t[0], datetime):
 				hours = Tide._hours(t[0], t)
 				t0 = t[0]
 			elif t0 is not None:
@@ -345,12 +700,33 @@ class Tide(object):
 		#consider these constant and equal to their speed at t0, regardless of
 		#the length of the time series.
 
-		partition = 240.0
+		partition = cls.partition
 
 		t     = Tide._partition(hours, partition)
 		times = Tide._times(t0, [(i + 0.5)*partition for i in range(len(t))])
 
-		speed, u, f, V0 = Tide._prepare(constituents, t0, times, radians = True)
+		speed, u, f, V0 = Tide._prepare(constituents, t0, times, radians = True, partition = partition)
+
+		model = np.zeros(1+n, dtype=cls.dtype)
+		model[0] = (constituent._Z0, z0, 0)
+		model[1:]['constituent'] = constituents[:]
+
+		if method == 'linear':
+			#H f cos(speed t + u + V0 - p) is linear in H cos(p) and H sin(p)
+			#so the least squares fit is a single linear solve.
+			A = np.concatenate([
+				np.append(f_i*np.cos(speed*t_i+u_i+V0), f_i*np.sin(speed*t_i+u_i+V0), axis=0)
+				for t_i, u_i, f_i in izip(t, u, f)],
+				axis = 1)
+			lsq = np.linalg.lstsq(A.T, heights, rcond = None)
+			hc, hs = lsq[0][:n], lsq[0][n:]
+			if callback:
+				callback(heights - np.dot(lsq[0], A))
+			model[1:]['amplitude'] = np.hypot(hc, hs)
+			model[1:]['phase'] = np.arctan2(hs, hc)
+			if full_output:
+				return cls(model = model, radians = True), lsq
+			return cls(model = model, radians = True)
 
 		#Residual to be minimised by variation of parameters (amplitudes, phases)
 		def residual(hp):
@@ -397,14 +773,132 @@ class Tide(object):
 
 		initial = np.append(amplitudes, phases)
 
+		from scipy.optimize import leastsq
 		lsq = leastsq(residual, initial, Dfun=D_residual, col_deriv=True, ftol=1e-7)
 
-		model = np.zeros(1+n, dtype=cls.dtype)
-		model[0] = (constituent._Z0, z0, 0)
-		model[1:]['constituent'] = constituents[:]
 		model[1:]['amplitude'] = lsq[0][:n]
 		model[1:]['phase'] = lsq[0][n:]
 
 		if full_output:
 			return cls(model = model, radians = True), lsq
 		return cls(model = model, radians = True)
+
+class HarmonicAccumulator(object):
+	"""
+	Fit a Tide to observations supplied in chunks, by accumulating the normal
+	equations of the linear least squares problem solved by
+	Tide.decompose(method = 'linear').  Memory depends on the number of
+	constituents and not on the length of the record, and a saved
+	accumulator can be loaded to add new observations to an existing fit.
+	"""
+
+	def __init__(self, t0, constituents = constituent.noaa, partition = None):
+		"""
+		Arguments:
+		t0 -- datetime (or datetime64, UTC) from which partitions are counted
+		constituents -- list of constituents to use in the fit (default: constituent.noaa)
+		partition -- number of hours for which we consider the node factors to be constant (default: Tide.partition)
+		"""
+		if isinstance(t0, datetime) and t0.tzinfo is not None:
+			t0 = t0.astimezone(timezone.utc).replace(tzinfo = None)
+		self.t0 = np.datetime64(t0, 'ns')
+		#As in Tide.decompose, drop duplicate constituents and fit the mean
+		#water level as an extra column rather than a constituent.
+		self.constituents = [
+			c for c in OrderedDict.fromkeys(constituents) if not c == constituent._Z0
+		]
+		self.partition = float(Tide.partition if partition is None else partition)
+		m = 2*len(self.constituents) + 1
+		self.normal = np.zeros((m, m))
+		self.rhs = np.zeros(m)
+		self.count = 0
+		self.span = np.array([np.inf, -np.inf])
+
+	def add(self, heights, t):
+		"""
+		Add a chunk of observations.  Missing (NaN) heights are ignored.
+		Arguments:
+		heights -- ndarray of tidal observation heights
+		t -- observation times; datetimes, datetime64 or hours since t0
+		"""
+		heights = np.asarray(heights, dtype = float)
+		t64 = Tide._datetime64(t)
+		if t64 is not None:
+			hours = Tide._hours(self.t0, t64)
+		elif len(t) and isinstance(t[0], datetime):
+			hours = Tide._hours(self.t0, Tide._datetime64(np.array(
+				[ti.astimezone(timezone.utc).replace(tzinfo = None) if ti.tzinfo else ti for ti in t],
+				dtype = 'datetime64[ns]')))
+		else:
+			hours = np.asarray(t, dtype = float)
+		valid = np.isfinite(heights)
+		hours, heights = hours[valid], heights[valid]
+		if len(hours) == 0:
+			return self
+
+		index = np.floor(hours / self.partition).astype(np.int64)
+		partitions = np.unique(index)
+		times = Tide._times(self.t0, (partitions + 0.5) * self.partition)
+		speed, u, f, V0 = Tide._prepare(self.constituents, self.t0, times, radians = True, partition = self.partition)
+		for k, u_k, f_k in izip(partitions, u, f):
+			t_k = hours[index == k]
+			arg = speed*t_k + u_k + V0
+			A = np.concatenate([f_k*np.cos(arg), f_k*np.sin(arg), np.ones((1, len(t_k)))])
+			self.normal += np.dot(A, A.T)
+			self.rhs += np.dot(A, heights[index == k])
+
+		self.count += len(hours)
+		self.span = np.array([min(self.span[0], hours.min()), max(self.span[1], hours.max())])
+		return self
+
+	def solve(self, n_period = 2):
+		"""
+		Return the Tide fitted to all of the observations added so far.
+		Arguments:
+		n_period -- only include constituents which complete at least this many periods (default: 2)
+		"""
+		if self.count == 0:
+			raise ValueError("No observations have been added.")
+		n = len(self.constituents)
+		speed, _, _, _ = Tide._prepare(self.constituents, self.t0, radians = False)
+		keep = np.nonzero(360.0 * n_period < (self.span[1] - self.span[0]) * speed[:, 0])[0]
+		columns = np.concatenate([keep, n + keep, [2*n]])
+		x = np.linalg.lstsq(self.normal[np.ix_(columns, columns)], self.rhs[columns], rcond = None)[0]
+		hc, hs = x[:len(keep)], x[len(keep):-1]
+
+		model = np.zeros(1 + len(keep), dtype = Tide.dtype)
+		model[0] = (constituent._Z0, x[-1], 0)
+		model[1:]['constituent'] = [self.constituents[i] for i in keep]
+		model[1:]['amplitude'] = np.hypot(hc, hs)
+		model[1:]['phase'] = np.arctan2(hs, hc)
+		return Tide(model = model, radians = True)
+
+	def save(self, path):
+		"""
+		Save the accumulated state to a .npz file.
+		"""
+		np.savez(path,
+			t0 = self.t0,
+			constituents = np.array([c.name for c in self.constituents]),
+			partition = self.partition,
+			normal = self.normal,
+			rhs = self.rhs,
+			count = self.count,
+			span = self.span)
+
+	@classmethod
+	def load(cls, path):
+		"""
+		Load an accumulator saved with save(), to which more observations can
+		be added.
+		"""
+		with np.load(path) as state:
+			accumulator = cls(
+				state['t0'],
+				[getattr(constituent, '_' + name) for name in state['constituents']],
+				float(state['partition']))
+			accumulator.normal = state['normal']
+			accumulator.rhs = state['rhs']
+			accumulator.count = int(state['count'])
+			accumulator.span = state['span']
+		return accumulator
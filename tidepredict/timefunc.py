@@ -4,10 +4,69 @@
 
 """
 import datetime
+import numpy as np
 import pytz
 import sys
+import threading
 from tidepredict import constants
 
+#TimezoneFinder shared by all timezone lookups, created on first use
+_finder = None
+_finder_lock = threading.Lock()
+
+def timezone_finder():
+    """Returns the shared timezonefinder.TimezoneFinder.
+
+    Creating a finder loads the timezone polygons into memory, so it is only
+    done once per process and only when a timezone has to be looked up.
+    """
+    global _finder
+    with _finder_lock:
+        if _finder is None:
+            import timezonefinder
+            _finder = timezonefinder.TimezoneFinder(in_memory=True)
+        return _finder
+
+def station_timezone(lat, lon):
+    """Returns the name of the timezone at a position in decimal degrees"""
+    return timezone_finder().timezone_at(lng=lon, lat=lat)
+
+#UTC transition times and offsets (in seconds) of pytz timezones
+_transitions = {}
+
+def utc_datetime64(times):
+    """Returns a datetime64[us] array of UTC times from a sequence of
+    datetimes. Naive datetimes are taken to be UTC.
+    """
+    return np.array([t if t.tzinfo is None else
+                     t.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+                     for t in times], dtype="datetime64[us]")
+
+def utc_offsets(times, tz):
+    """Returns the UTC offsets in seconds of a timezone at a datetime64
+    array of UTC times.
+
+    pytz timezones are looked up in their table of transitions with one
+    binary search for all the times, as tz.fromutc does for each.
+    """
+    times = np.asarray(times, dtype="datetime64[us]")
+    if getattr(tz, "_utc_transition_times", None):
+        try:
+            transitions, offsets = _transitions[tz.zone]
+        except KeyError:
+            transitions = np.array(tz._utc_transition_times,
+                                   dtype="datetime64[us]")
+            offsets = np.array([info[0].total_seconds()
+                                for info in tz._transition_info])
+            _transitions[tz.zone] = transitions, offsets
+        index = np.searchsorted(transitions, times, side="right") - 1
+        return offsets[np.maximum(index, 0)]
+    if isinstance(tz, (pytz.tzinfo.StaticTzInfo, type(pytz.utc),
+                       datetime.timezone)):
+        return np.full(times.shape, tz.utcoffset(None).total_seconds())
+    return np.array([tz.utcoffset(t.item()).total_seconds()
+                     for t in times])
+
 class Tidetime:
 
     def __init__(self,
@@ -53,6 +112,18 @@ class Tidetime:
         time = time + datetime.timedelta(minutes=time.second > 30)
         return time
     
+    def localise_array(self, times):
+        """Localises an array of UTC datetime64 times as localise does,
+        returning datetime64[m] local times
+        """
+        times = np.asarray(times, dtype="datetime64[us]")
+        offsets = utc_offsets(times, self.tz)
+        local = times.astype("datetime64[s]") \
+                + np.round(offsets).astype("timedelta64[s]")
+        #round to the minute as localise does
+        seconds = (local - local.astype("datetime64[m]")).astype(int)
+        return local.astype("datetime64[m]") + (seconds > 30)
+
     def localiselist(self,timelist):
         return [item.astimezone(self.tz) for item in timelist]    
         
\ No newline at end of file